@@ -0,0 +1,78 @@
+"""
+Measures the overhead of reading config in a hot listener, awaiting the `Cfg`
+descriptor for every reaction against reading the pre-converted snapshot.
+
+    GUILD_ID=1 PANTRY_GUILD=2 poetry run python benchmarks/config_snapshot.py
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))
+
+from cogs._config import _store, clear_cache  # noqa: E402
+from cogs.reaction_utils import ReactionUtilsCog  # noqa: E402
+
+REACTIONS = 20
+ROUNDS = 20_000
+
+
+def reactions() -> list[SimpleNamespace]:
+    # the worst case, nothing reaches the pin count and every reaction reads it
+    return [SimpleNamespace(emoji="📌", count=1) for _ in range(REACTIONS)]
+
+
+async def awaited(cog: ReactionUtilsCog, reacts: list) -> bool:
+    # pin_handle as it was, awaiting the option for every reaction
+    for react in reacts:
+        if react.emoji == "📌" and react.count >= await cog.pin_count:
+            return True
+    return False
+
+
+async def snapshot(cog: ReactionUtilsCog, reacts: list) -> bool:
+    pin_count = cog.snapshot.pin_count
+    for react in reacts:
+        if react.emoji == "📌" and react.count >= pin_count:
+            return True
+    return False
+
+
+async def measure(check, cog, reacts) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await check(cog, reacts)
+    return (time.perf_counter() - start) / ROUNDS
+
+
+async def main():
+    clear_cache()
+    cog = ReactionUtilsCog(MagicMock())
+    _store(cog.key, {"key": cog.key, "pin_count": "5", "timeout_count": "5"})
+    reacts = reactions()
+
+    before = await measure(awaited, cog, reacts)
+    after = await measure(snapshot, cog, reacts)
+    print(f"{REACTIONS} reactions per message")
+    print(f"awaiting Cfg: {before * 1e6:.2f} µs per message")
+    print(f"snapshot:     {after * 1e6:.2f} µs per message")
+    print(f"speedup: {before / after:.1f}x")
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await cog.pin_count
+    read_before = (time.perf_counter() - start) / ROUNDS
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        cog.snapshot.pin_count
+    read_after = (time.perf_counter() - start) / ROUNDS
+    print(
+        f"single read: {read_before * 1e9:.0f} ns awaited, {read_after * 1e9:.0f} ns snapshot"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""
+Compares the offline token estimator with Gemini's `count_tokens`.
+
+Calibrates the estimator on half of the samples, reports its error distribution
+on the other half and how much faster it is than the remote call. The printed
+weights can be set as the `TOKEN_ESTIMATOR` option of the TL;DR cog.
+
+    poetry run python benchmarks/token_estimator.py [samples.txt] [--model NAME]
+
+Each line of `samples.txt` is one sample, e.g. a serialized conversation window.
+Without it, samples are generated from a few czech and english messages.
+Needs `GEMINI_TOKEN` in `.env`.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))
+
+from cogs.utils.gemini import gemini  # noqa: E402
+from cogs.utils.token_estimator import TokenEstimator  # noqa: E402
+
+MESSAGES = [
+    "Ahoj, jdete dneska někdo na oběd?",
+    "Já jo, ve 12:30 u menzy",
+    "Tohle je fakt hrozný, zase mi spadl build :(",
+    "Did anyone try the new release? https://example.com/changelog",
+    "Příští týden je zkouška z lineární algebry, máte někdo zápisky?",
+    "lol 😂😂",
+    "Kdo ví, proč `pip install` hází SSLError?",
+    "Zítra v 18:00 pivo, kdo dorazí? 🍺",
+    "That's not how async works, you need to await the coroutine",
+    "Střední hodnota je 42.5, rozptyl 3.14159",
+]
+
+
+def generated_samples(count: int) -> list[str]:
+    rng = random.Random(0)
+    samples = []
+    for _ in range(count):
+        window = [
+            {
+                "id": rng.randrange(10**17, 10**18),
+                "author": rng.choice(["pepa", "franta_99", "Kateřina"]),
+                "created_at": f"2024-0{rng.randint(1, 9)}-1{rng.randint(0, 9)} 12:00:00",
+                "message": " ".join(rng.sample(MESSAGES, rng.randint(1, 4))),
+            }
+            for _ in range(rng.randint(1, 40))
+        ]
+        samples.append(", ".join(json.dumps(msg) for msg in window))
+    return samples
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("samples", nargs="?", type=Path)
+    parser.add_argument("--model", default="gemini-1.5-flash")
+    parser.add_argument("--count", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.samples:
+        samples = args.samples.read_text().splitlines()[: args.count]
+    else:
+        samples = generated_samples(args.count)
+
+    counts = []
+    remote_start = time.perf_counter()
+    for sample in samples:
+        counts.append(await gemini.count_tokens(args.model, sample))
+    remote = (time.perf_counter() - remote_start) / len(samples)
+
+    half = len(samples) // 2
+    estimator = TokenEstimator.calibrate(zip(samples[:half], counts[:half]))
+
+    local_start = time.perf_counter()
+    estimates = [estimator.estimate(sample) for sample in samples[half:]]
+    local = (time.perf_counter() - local_start) / len(estimates)
+
+    errors = [(e - c) / c for e, c in zip(estimates, counts[half:]) if c]
+    absolute = [abs(e) for e in errors]
+    print(f"samples: {len(samples)} ({half} for calibration)")
+    print(f"weights: {estimator}")
+    print(f"mean error: {statistics.mean(errors):+.2%} (bias)")
+    for q in (0.5, 0.9, 0.95, 0.99):
+        print(f"p{int(q * 100)} absolute error: {percentile(absolute, q):.2%}")
+    print(f"max absolute error: {max(absolute):.2%}")
+    print(f"count_tokens: {remote * 1000:.1f} ms, estimator: {local * 1e6:.1f} µs")
+    print(f"speedup: {remote / local:,.0f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
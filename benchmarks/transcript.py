@@ -0,0 +1,119 @@
+"""
+Measures how many more TL;DR messages fit under the token limit with the compact
+transcript format than with one `json.dumps` object per message.
+
+    poetry run python benchmarks/transcript.py --remote [--limit 100000]
+
+Token counts come from Gemini's `count_tokens` (needs `GEMINI_TOKEN` in `.env`),
+the offline estimator isn't calibrated and its counts would say nothing about
+real token usage. Without `--remote` only the sizes in characters are compared,
+which is not a token saving.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))
+
+from cogs.utils.transcript import render_transcript  # noqa: E402
+
+AUTHORS = ["pepa", "franta_99", "Kateřina", "xX_gamer_Xx", "honza.novak"]
+TEXTS = [
+    "Ahoj, jdete dneska někdo na oběd?",
+    "ve 12:30 u menzy",
+    "jo",
+    "Tohle je fakt hrozný, zase mi spadl build :(",
+    "Did anyone try the new release?",
+    "Příští týden je zkouška z lineární algebry, máte někdo zápisky?",
+    "lol",
+    "Kdo ví, proč `pip install` hází SSLError?",
+    "Zítra v 18:00 pivo, kdo dorazí?",
+    "That's not how async works, you need to await the coroutine",
+]
+
+
+def conversation(count: int) -> list[dict]:
+    rng = random.Random(0)
+    created_at = datetime(2024, 5, 1, 12, 0)
+    snowflake = 1234567890123456789
+    messages = []
+    author = rng.choice(AUTHORS)
+    for _ in range(count):
+        if rng.random() < 0.6:
+            author = rng.choice(AUTHORS)
+        created_at += timedelta(seconds=rng.expovariate(1 / 120))
+        snowflake += rng.randrange(1 << 22, 1 << 32)
+        msg = {
+            "id": snowflake,
+            "author": author,
+            "created_at": created_at,
+            "message": rng.choice(TEXTS),
+        }
+        if messages and rng.random() < 0.2:
+            msg["reply_to"] = rng.choice(messages[-20:])["id"]
+        messages.append(msg)
+    return messages
+
+
+def as_json(messages: list[dict]) -> str:
+    # the format TL;DR used before, with timestamps formatted as strings
+    return json.dumps(
+        [
+            {**msg, "created_at": msg["created_at"].strftime("%Y-%m-%d %H:%M:%S")}
+            for msg in messages
+        ]
+    )
+
+
+async def fitting(messages: list[dict], render, measure, limit: int) -> int:
+    """The most messages that fit under the limit"""
+    lo, hi = 0, len(messages)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if await measure(render(messages[:mid])) <= limit:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=100_000)
+    parser.add_argument("--remote", action="store_true")
+    parser.add_argument("--model", default="gemini-1.5-flash")
+    args = parser.parse_args()
+
+    messages = conversation(50_000)
+    if args.remote:
+        from cogs.utils.gemini import gemini
+
+        async def measure(text: str) -> int:
+            return await gemini.count_tokens(args.model, text)
+
+        print(f"Gemini tokens (limit {args.limit}):")
+        limit = args.limit
+    else:
+
+        async def measure(text: str) -> int:
+            return len(text)
+
+        # characters are budgeted at four per token
+        limit = args.limit * 4
+        print(f"characters (limit {limit}), not tokens, pass --remote for those:")
+
+    results = {}
+    for name, render in (("json", as_json), ("transcript", render_transcript)):
+        count = await fitting(messages, render, measure, limit)
+        results[name] = count
+        print(f"  {name}: {count} messages", end="")
+        print(f", {len(render(messages[:count]))} characters")
+    print(f"  {results['transcript'] / results['json']:.2f}x more messages fit")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,13 +1,14 @@
 import os
+import asyncio
 import discord
 from traceback import print_exc
 from io import StringIO
-import httpx
 
 from discord.ext import commands
 import motor.motor_asyncio as ma
 
 from consts import TOKEN, GUILD, DB_CONN, COGS_DIR, ERROR_WH, PANTRY_GUILD
+from http_pool import HttpClientPool
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -18,6 +19,9 @@ backrooms = discord.Object(id=GUILD)
 
 
 class BackroomsBot(commands.Bot):
+    http_pool: HttpClientPool
+    config_watch: asyncio.Task
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         db_client = ma.AsyncIOMotorClient(DB_CONN)
@@ -26,6 +30,16 @@ class BackroomsBot(commands.Bot):
         self.pantry_id = int(PANTRY_GUILD)
 
     async def setup_hook(self):
+        # shared keep-alive HTTP clients, borrowed by the cogs
+        self.http_pool = HttpClientPool()
+
+        # imported here, the config module itself depends on this one
+        from cogs._config import preload, watch
+
+        # every cog's configuration in one query, kept fresh by a change stream
+        await preload(self.db.config)
+        self.config_watch = asyncio.create_task(watch(self.db.config))
+
         # loads all cogs
         for filename in os.listdir(COGS_DIR):
             if filename.endswith("py") and not filename.startswith("_"):
@@ -36,6 +50,13 @@ class BackroomsBot(commands.Bot):
         # syncs the command tree with the backrooms guild
         await self.tree.sync(guild=self.backrooms)
 
+    async def close(self):
+        if hasattr(self, "config_watch"):
+            self.config_watch.cancel()
+        await super().close()
+        if hasattr(self, "http_pool"):
+            await self.http_pool.aclose()
+
     async def on_error(self, event: str, *args, **kwargs):
         content = StringIO()
         print_exc(file=content)
@@ -50,11 +71,10 @@ class BackroomsBot(commands.Bot):
                 }
             ],
         }
-        async with httpx.AsyncClient() as cl:
-            # use a webhook instead of the discord connection in
-            # case the error is caused by being disconnected from discord
-            # also prevents error reporting from breaking API limits
-            await cl.post(ERROR_WH, json=data)
+        # use a webhook instead of the discord connection in
+        # case the error is caused by being disconnected from discord
+        # also prevents error reporting from breaking API limits
+        await self.http_pool.client(ERROR_WH).post(ERROR_WH, json=data)
 
 
 client = BackroomsBot(command_prefix="!", intents=intents)
@@ -4,42 +4,202 @@ from discord.ext import commands
 from discord import Interaction, AllowedMentions
 import discord.ui as ui
 import asyncio
+import time
 from contextlib import suppress
+from traceback import print_exc
+from types import MethodType
+from weakref import WeakMethod
 import motor.motor_asyncio as maio
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure, PyMongoError
 
 _NO_VALUE = object()
 
-_CACHE: dict[str, Any] = {}
+# how long a cached configuration is trusted, in seconds
+CACHE_TTL = 300
+
+# key -> (expires at, configuration)
+_CACHE: dict[str, tuple[float, dict[str, Any]]] = {}
+# key -> the load in progress, shared by everyone who missed the cache meanwhile
+_LOADING: dict[str, asyncio.Future] = {}
+# until when every configuration is known to be cached, keys missing from the cache
+# have no configuration then
+_preloaded_until = 0.0
+# key -> the immutable converted configuration, swapped whenever the key is stored
+_SNAPSHOTS: dict[str, "ConfigSnapshot"] = {}
+# key -> the ConfigCog class configured by it
+_REGISTRY: dict[str, type["ConfigCog"]] = {}
+# key -> callbacks (or weak references to bound methods) to call with the new
+# snapshot when the configuration changes
+_SUBSCRIBERS: dict[str, list[Callable[[], Any]]] = {}
+# key -> the configuration the subscribers know about
+_NOTIFIED: dict[str, dict[str, Any]] = {}
+# keeps the running notifications from being garbage collected
+_NOTIFYING: set[asyncio.Task] = set()
+# bumped on every write to the cache, so a slow load can't overwrite newer values
+_epoch = 0
+_versions: dict[str, int] = {}
+# document _id -> key, change streams only tell the _id of a deleted document
+_IDS: dict[Any, str] = {}
+
+
+def _expire_snapshots():
+    # snapshots are kept, so the last known configuration stays readable until
+    # the next load, they are only marked for a refresh
+    for snapshot in _SNAPSHOTS.values():
+        snapshot.__dict__["expires_at"] = 0.0
+
+
+def _expire():
+    """
+    Make every cached configuration load again on its next use, the values
+    are kept for the snapshots
+    """
+    global _preloaded_until, _epoch
+    for key, (_, value) in _CACHE.items():
+        _CACHE[key] = (0.0, value)
+    _preloaded_until = 0.0
+    _epoch += 1
+    _expire_snapshots()
 
 
 def clear_cache():
+    global _preloaded_until, _epoch
     _CACHE.clear()
+    _preloaded_until = 0.0
+    _epoch += 1
+    _expire_snapshots()
 
 
-async def _cached_get(col: maio.AsyncIOMotorCollection, key: str) -> dict[str, Any]:
+def _store(key: str, value: dict[str, Any]):
+    _CACHE[key] = (time.monotonic() + CACHE_TTL, value)
+    _versions[key] = _versions.get(key, 0) + 1
+    if "_id" in value:
+        _IDS[value["_id"]] = key
+    if (cog := _REGISTRY.get(key)) is not None:
+        _SNAPSHOTS[key] = ConfigSnapshot(cog.options, value, _CACHE[key][0])
+    previous = _NOTIFIED.get(key, {})
+    _NOTIFIED[key] = value
+    if value != previous and key in _SNAPSHOTS:
+        _notify(key, _SNAPSHOTS[key])
+
+
+async def _run_subscriber(callback, snapshot: "ConfigSnapshot"):
+    try:
+        await callback(snapshot)
+    except Exception:
+        print_exc()
+
+
+def _notify(key: str, snapshot: "ConfigSnapshot"):
+    subscribers = _SUBSCRIBERS.get(key, [])
+    for ref in subscribers[:]:
+        callback = ref()
+        if callback is None:
+            # the subscribed cog is gone
+            subscribers.remove(ref)
+            continue
+        task = asyncio.ensure_future(_run_subscriber(callback, snapshot))
+        _NOTIFYING.add(task)
+        task.add_done_callback(_NOTIFYING.discard)
+
+
+async def preload(col: maio.AsyncIOMotorCollection):
     """
-    Load a cogs configuration, or find it in the cache if it is present there
+    Load the configuration of every cog in a single query
     """
+    global _preloaded_until
+    docs = [doc async for doc in col.find({})]
+    clear_cache()
+    for doc in docs:
+        _store(doc["key"], doc)
+    _preloaded_until = time.monotonic() + CACHE_TTL
+
+
+async def watch(col: maio.AsyncIOMotorCollection):
+    """
+    Keep the cache up to date with changes made by other processes, using a change stream.
+
+    Change streams need a replica set, without it the cache relies only on the TTL.
+    """
+    while True:
+        try:
+            async with col.watch(full_document="updateLookup") as stream:
+                async for change in stream:
+                    doc = change.get("fullDocument")
+                    if doc is not None and "key" in doc:
+                        _store(doc["key"], doc)
+                    elif change["operationType"] == "delete":
+                        doc_id = change["documentKey"]["_id"]
+                        if (key := _IDS.pop(doc_id, None)) is not None:
+                            _store(key, {})
+                    else:
+                        # the collection was dropped or renamed, or the document
+                        # was gone before it could be looked up
+                        _expire()
+        except OperationFailure:
+            print("Config change streams are not available, relying on the cache TTL")
+            return
+        except PyMongoError:
+            # changes may have been missed while the stream was down
+            _expire()
+            await asyncio.sleep(5)
+
+
+async def _load(col: maio.AsyncIOMotorCollection, key: str) -> dict[str, Any]:
+    version = (_epoch, _versions.get(key))
+    result = await col.find_one({"key": key}) or {}
+    if version == (_epoch, _versions.get(key)):
+        _store(key, result)
+    return result
+
+
+def _fresh(key: str) -> dict[str, Any] | None:
+    """The cached configuration, None if it has to be loaded"""
+    now = time.monotonic()
+    entry = _CACHE.get(key)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    if entry is None and _preloaded_until > now:
+        # the cog has no configuration
+        return {}
+    return None
+
+
+def _start_load(col: maio.AsyncIOMotorCollection, key: str) -> asyncio.Future:
     try:
-        return _CACHE[key]
+        return _LOADING[key]
     except KeyError:
-        result = await col.find_one({"key": key}) or {}
-        _CACHE[key] = result
-        return result
+        loading = _LOADING[key] = asyncio.ensure_future(_load(col, key))
+        loading.add_done_callback(lambda _: _LOADING.pop(key, None))
+        return loading
+
+
+async def _cached_get(col: maio.AsyncIOMotorCollection, key: str) -> dict[str, Any]:
+    """
+    Load a cogs configuration, or find it in the cache if it is present there
+    """
+    if (config := _fresh(key)) is not None:
+        return config
+    # a cancelled caller must not cancel the load for the others
+    return await asyncio.shield(_start_load(col, key))
 
 
 async def _cached_update(
     col: maio.AsyncIOMotorCollection, key: str, values: dict[str, Any]
 ):
     """
-    Update a cogs configuration, invalidating its cache entry.
+    Update a cogs configuration, refreshing its cache entry.
 
     The parameter values must include the key as well
     """
-    with suppress(KeyError):
-        # leave the race condition to mongodb
-        del _CACHE[key]
-    await col.update_one({"key": key}, {"$set": values}, upsert=True)
+    result = await col.find_one_and_update(
+        {"key": key},
+        {"$set": values},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    _store(key, result)
 
 
 class Cfg:
@@ -66,18 +226,24 @@ class Cfg:
         """
         return self.t(value)
 
-    async def get(self, obj):
+    def value(self, config: dict[str, Any]):
         """
-        Get this config option, given the ConfigCog instance
+        Get this config option from the cogs configuration document
         """
         if self.default is _NO_VALUE:
-            return self.convert((await obj._cfg())[self.name])
+            return self.convert(config[self.name])
         else:
-            if (value := (await obj._cfg()).get(self.name, _NO_VALUE)) is _NO_VALUE:
+            if (value := config.get(self.name, _NO_VALUE)) is _NO_VALUE:
                 return self.default
             else:
                 return self.convert(value)
 
+    async def get(self, obj):
+        """
+        Get this config option, given the ConfigCog instance
+        """
+        return self.value(await obj._cfg())
+
     @property
     def label(self):
         """
@@ -111,6 +277,37 @@ class Cfg:
         raise RuntimeError("cannot set config value")
 
 
+class ConfigSnapshot:
+    """
+    An immutable view of a cogs configuration, with every option already converted.
+
+    Options read as plain attributes, an option that is not set and has no default
+    (or fails to convert) raises the same error as awaiting it would.
+    """
+
+    def __init__(
+        self, options: list[Cfg], config: dict[str, Any], expires_at: float = 0.0
+    ) -> None:
+        values: dict[str, Any] = {"expires_at": expires_at, "_errors": {}}
+        for option in options:
+            try:
+                values[option.name] = option.value(config)
+            except Exception as e:
+                values["_errors"][option.name] = e
+        self.__dict__.update(values)
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for options that failed to load
+        try:
+            error = self._errors[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        raise error
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("config snapshots are immutable")
+
+
 class ConfigCog(commands.Cog):
     key: str
     options: list[Cfg]
@@ -125,8 +322,63 @@ class ConfigCog(commands.Cog):
     async def _cfg(self) -> dict[Any, Any]:
         return await _cached_get(self.config, self.key)
 
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        """
+        The configuration for synchronous access, e.g. in hot listeners.
+
+        Once the cache entry expires, it's refreshed in the background
+        and the last known configuration is used meanwhile.
+        """
+        snapshot = _SNAPSHOTS.get(self.key)
+        if snapshot is not None and snapshot.expires_at > time.monotonic():
+            return snapshot
+        config = _fresh(self.key)
+        if config is None:
+            _start_load(self.config, self.key)
+            if snapshot is not None:
+                return snapshot
+            # not loaded yet
+            config, expires_at = {}, 0.0
+        elif (entry := _CACHE.get(self.key)) is not None:
+            expires_at = entry[0]
+        else:
+            # a cog without configuration after the preload
+            expires_at = _preloaded_until
+        snapshot = ConfigSnapshot(self.options, config, expires_at)
+        _SNAPSHOTS[self.key] = snapshot
+        return snapshot
+
+    def subscribe(
+        self, callback: Callable[["ConfigSnapshot"], Awaitable[None]]
+    ) -> Callable[[], None]:
+        """
+        Call `callback` with the new snapshot whenever the configuration of this cog
+        changes, be it through `/config` or by a write to the database elsewhere.
+
+        Bound methods are referenced weakly, so an unloaded cog stops being notified.
+        Returns a function that cancels the subscription.
+        """
+        if isinstance(callback, MethodType):
+            ref = WeakMethod(callback)
+        else:
+
+            def ref():
+                return callback
+
+        subscribers = _SUBSCRIBERS.setdefault(self.key, [])
+        subscribers.append(ref)
+
+        def unsubscribe():
+            with suppress(ValueError):
+                subscribers.remove(ref)
+
+        return unsubscribe
+
     def __init_subclass__(cls) -> None:
         cls.key = cls.__module__
+        cls.options = getattr(cls, "options", [])
+        _REGISTRY[cls.key] = cls
 
 
 async def gen_modal(t: str, items: list[Cfg], inst: ConfigCog) -> ui.Modal:
@@ -0,0 +1,91 @@
+import discord
+from discord.ext import commands, tasks
+
+from bot import BackroomsBot
+from ._config import ConfigCog, ConfigSnapshot, Cfg
+from .utils.archive import ArchivedMessage, MessageArchive, fetch_history
+
+
+class ArchiveCog(ConfigCog):
+    """Archives the messages of the guild, so history ranges don't have to be paged over REST"""
+
+    enabled = Cfg(int, default=0)
+
+    def __init__(self, bot: BackroomsBot) -> None:
+        super().__init__(bot)
+        self.archive = MessageArchive(
+            self.bot.db.message_archive, self.bot.db.message_archive_spans
+        )
+        self.subscribe(self.configure)
+
+    async def configure(self, cfg: ConfigSnapshot):
+        if not cfg.enabled:
+            # nothing is followed while disabled, don't serve gaps as covered
+            # once enabled again
+            await self.archive.forget()
+
+    async def cog_load(self):
+        await self.archive.ensure_indexes()
+        self.flush_spans.start()
+
+    async def cog_unload(self):
+        self.flush_spans.cancel()
+        await self.archive.close_live()
+
+    @tasks.loop(minutes=1)
+    async def flush_spans(self):
+        await self.archive.flush()
+
+    async def history(
+        self,
+        channel: discord.abc.GuildChannel,
+        after: int | None = None,
+        before: int | None = None,
+        limit: int = 100,
+        oldest_first: bool = True,
+    ) -> list[ArchivedMessage]:
+        """Messages between the two snowflakes (exclusive), see `MessageArchive.history`"""
+        if not await self.enabled:
+            return await fetch_history(channel, after, before, limit, oldest_first)
+        return await self.archive.history(channel, after, before, limit, oldest_first)
+
+    async def _active(self) -> bool:
+        if await self.enabled:
+            return True
+        if self.archive.live:
+            # the archive stops following the channels
+            await self.archive.forget()
+        return False
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.guild is None or not await self._active():
+            return
+        await self.archive.record(ArchivedMessage.from_message(message))
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        if "content" not in payload.data or not await self._active():
+            return
+        await self.archive.edit(payload.message_id, payload.data["content"])
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if await self._active():
+            await self.archive.delete([payload.message_id])
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(
+        self, payload: discord.RawBulkMessageDeleteEvent
+    ):
+        if await self._active():
+            await self.archive.delete(list(payload.message_ids))
+
+    @commands.Cog.listener()
+    async def on_disconnect(self):
+        # events missed while disconnected would leave holes in the live spans
+        await self.archive.close_live()
+
+
+async def setup(bot: BackroomsBot) -> None:
+    await bot.add_cog(ArchiveCog(bot), guild=bot.backrooms)
@@ -2,7 +2,6 @@ import discord
 from discord import app_commands
 import tempfile
 from PIL import Image
-import httpx
 
 from bot import BackroomsBot
 from ._config import ConfigCog, Cfg
@@ -40,8 +39,8 @@ class AvatarEmojiCog(ConfigCog):
 
         with tempfile.TemporaryDirectory() as tempdir:
             # download the avatar
-            async with httpx.AsyncClient() as client:
-                response = await client.get(avatar_url, timeout=10)
+            client = self.bot.http_pool.client(avatar_url)
+            response = await client.get(avatar_url, timeout=10)
             image_path = f"{tempdir}/{member_id}.png"
             with open(image_path, "wb") as f:
                 f.write(response.content)
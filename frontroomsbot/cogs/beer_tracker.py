@@ -3,12 +3,16 @@ from discord.ext import commands
 from discord import app_commands
 from datetime import datetime, timedelta
 from typing import Optional, Literal
+import tempfile
 import uuid
 from zoneinfo import ZoneInfo
 
 from bot import BackroomsBot
+from .utils.beers import BeerStore, decode_cursor, encode_cursor
 
 prague_tz = ZoneInfo("Europe/Prague")
+PAGES_PREFIX = "my_beers"
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
 
 
 def ts_to_prague_time(ts: datetime) -> datetime:
@@ -18,9 +22,64 @@ def ts_to_prague_time(ts: datetime) -> datetime:
     return ts.astimezone(prague_tz)
 
 
+def histogram(labels: list[str], counts: list[int], width: int = 16) -> str:
+    """A text bar chart for an embed"""
+    top = max(counts) or 1
+    lines = [
+        f"{label:>3} {'█' * round(count / top * width):<{width}} {count}"
+        for label, count in zip(labels, counts)
+    ]
+    return "```\n" + "\n".join(lines) + "\n```"
+
+
+class BeerPagesView(discord.ui.View):
+    """
+    Previous/Next buttons of `/my_beers`, the custom ids carry the page and the
+    cursor of the first or last beer shown, clicks are handled by
+    `BeerTrackerCog.on_interaction` so that the buttons survive restarts.
+
+    The view only renders the buttons, it's stopped right away so that discord.py
+    doesn't keep it around to dispatch clicks to.
+    """
+
+    def __init__(
+        self,
+        number: int,
+        limit: int,
+        first: dict,
+        last: dict,
+        has_newer: bool,
+        has_older: bool,
+    ) -> None:
+        super().__init__(timeout=None)
+        self.add_item(
+            discord.ui.Button(
+                label="Previous",
+                emoji="⬅️",
+                custom_id=f"{PAGES_PREFIX}:newer:{number}:{limit}:{encode_cursor(first)}",
+                disabled=not has_newer,
+            )
+        )
+        self.add_item(
+            discord.ui.Button(
+                label="Next",
+                emoji="➡️",
+                custom_id=f"{PAGES_PREFIX}:older:{number}:{limit}:{encode_cursor(last)}",
+                disabled=not has_older,
+            )
+        )
+        self.stop()
+
+
 class BeerTrackerCog(commands.Cog):
     def __init__(self, bot: BackroomsBot) -> None:
         self.bot = bot
+        self.beers = BeerStore(bot.db)
+
+    async def cog_load(self):
+        await self.beers.ensure_indexes()
+        # one-shot conversion of the embedded beer arrays, a no-op once done
+        await self.beers.migrate()
 
     @app_commands.command(
         name="beer", description="Log a beer for yourself or someone else! 🍺"
@@ -29,100 +88,136 @@ class BeerTrackerCog(commands.Cog):
     async def log_beer(
         self, interaction: discord.Interaction, user: Optional[discord.User] = None
     ):
-        db = self.bot.db
         target_user = user or interaction.user
-        current_time = datetime.now()
-
-        # Get or create user's beer data
-        user_data = await db.beer_tracker.find_one({"user_id": target_user.id}) or {
-            "user_id": target_user.id,
-            "username": target_user.name,
-            "beers": [],
-            "total_beers": 0,
-        }
-
-        # Add new beer entry with timestamp and UUID
-        beer_id = str(uuid.uuid4())
-        user_data["beers"].append({"id": beer_id, "timestamp": current_time})
-
-        # update total beers count and username if necessary
-        user_data["total_beers"] += 1
-        user_data["username"] = target_user.name
-
-        # Save to DB
-        await db.beer_tracker.replace_one(
-            {"user_id": target_user.id}, user_data, upsert=True
-        )
+        total = await self.beers.log(target_user.id, target_user.name)
 
         await interaction.response.send_message(
-            f"{target_user.mention} has now drunk **{user_data['total_beers']}** beers total! 🍺"
+            f"{target_user.mention} has now drunk **{total}** beers total! 🍺"
         )
 
     @app_commands.command(
-        name="my_beers",
-        description="List your beer logs with UUIDs (used for deletion)",
+        name="beer_round", description="Log a round of beers for several people! 🍻"
     )
     @app_commands.describe(
-        limit="Number of beers to show (1-50)", page="Page number to view"
+        user1="Who drank?",
+        user2="Who else drank?",
+        user3="Who else drank?",
+        user4="Who else drank?",
+        user5="Who else drank?",
+        count="How many beers each (defaults to 1)",
     )
+    async def beer_round(
+        self,
+        interaction: discord.Interaction,
+        user1: discord.User,
+        user2: Optional[discord.User] = None,
+        user3: Optional[discord.User] = None,
+        user4: Optional[discord.User] = None,
+        user5: Optional[discord.User] = None,
+        count: app_commands.Range[int, 1, 10] = 1,
+    ):
+        # slash commands can't take a list of users, duplicates count once
+        users = {user.id: user for user in (user1, user2, user3, user4, user5) if user}
+        totals = await self.beers.log_round(
+            {user_id: user.name for user_id, user in users.items()}, count
+        )
+
+        response = [
+            f"🍻 {count} beer{'s' if count != 1 else ''} each for "
+            f"{len(users)} {'people' if len(users) != 1 else 'person'}!"
+        ]
+        for user_id, user in users.items():
+            response.append(f"{user.mention} - **{totals[user_id]}** beers total")
+        await interaction.response.send_message("\n".join(response))
+
+    @app_commands.command(
+        name="my_beers",
+        description="List your beer logs with UUIDs (used for deletion)",
+    )
+    @app_commands.describe(limit="Number of beers to show per page (1-25)")
     async def my_beers(
         self,
         interaction: discord.Interaction,
-        limit: app_commands.Range[int, 1, 50] = 10,
-        page: app_commands.Range[int, 1] = 1,
+        limit: app_commands.Range[int, 1, 25] = 10,
     ):
-        db = self.bot.db
-        user_data = await db.beer_tracker.find_one({"user_id": interaction.user.id})
-        if not user_data or not user_data["beers"]:
+        page = await self.beers_page(interaction.user.id, limit)
+        if page is None:
             await interaction.response.send_message(
                 "You haven't logged any beers yet! 🚱", ephemeral=True
             )
             return
 
-        # sort by newest
-        all_beers = sorted(
-            user_data["beers"], key=lambda x: x["timestamp"], reverse=True
-        )
-        total_beers = len(all_beers)
-        total_pages = (total_beers + limit - 1) // limit
+        embed, view = page
+        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
-        # validate page number
-        if page > total_pages:
-            await interaction.response.send_message(
-                f"Page {page} doesn't exist! There are only {total_pages} page(s) available.",
-                ephemeral=True,
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction: discord.Interaction):
+        """Previous/Next buttons of `/my_beers`, including ones sent before a restart"""
+        if interaction.type is not discord.InteractionType.component:
+            return
+        custom_id = interaction.data.get("custom_id", "")
+        if not custom_id.startswith(f"{PAGES_PREFIX}:"):
+            return
+
+        _, direction, number, limit, cursor = custom_id.split(":", 4)
+        newer = direction == "newer"
+        number = int(number) + (-1 if newer else 1)
+        page = await self.beers_page(
+            interaction.user.id, int(limit), number, decode_cursor(cursor), newer
+        )
+        if page is None:
+            await interaction.response.edit_message(
+                content="You haven't logged any beers yet! 🚱", embed=None, view=None
             )
             return
 
-        # pagination logic
-        start_idx = (page - 1) * limit
-        end_idx = start_idx + limit
-        paginated_beers = all_beers[start_idx:end_idx]
+        embed, view = page
+        await interaction.response.edit_message(embed=embed, view=view)
+
+    async def beers_page(
+        self,
+        user_id: int,
+        limit: int,
+        number: int = 1,
+        cursor: tuple[datetime, str] | None = None,
+        newer: bool = False,
+    ) -> tuple[discord.Embed, discord.ui.View] | None:
+        """The embed and buttons of a page of `/my_beers`, None without beers"""
+        beers, more = await self.beers.page(user_id, limit, cursor, newer)
+        if not beers and cursor is not None:
+            # the page was emptied by deletes, start over
+            return await self.beers_page(user_id, limit)
+        if not beers:
+            return None
+
+        if cursor is None:
+            has_newer, has_older = False, more
+        elif newer:
+            has_newer, has_older = more, True
+        else:
+            has_newer, has_older = True, more
+        if not has_newer:
+            number = 1
+
+        total_beers = await self.beers.total(user_id)
+        total_pages = max((total_beers + limit - 1) // limit, number)
 
         # build the embed
         embed = discord.Embed(
-            title=f"Your Beer Logs (Page {page}/{total_pages})",
+            title=f"Your Beer Logs (Page {number}/{total_pages})",
             description=f"Total beers: {total_beers}",
             color=discord.Color.blue(),
         )
 
-        for beer in paginated_beers:
+        for beer in beers:
             beer_time = ts_to_prague_time(beer["timestamp"]).strftime("%Y-%m-%d %H:%M")
             embed.add_field(
                 name=f"🍺 {beer_time}", value=f"`{beer['id']}`", inline=False
             )
 
-        # add footer for pagination
-        footer_parts = []
-        if page > 1:
-            footer_parts.append(f"Previous: /my_beers page={page-1}")
-        if page < total_pages:
-            footer_parts.append(f"Next: /my_beers page={page+1}")
-
-        if footer_parts:
-            embed.set_footer(text=" | ".join(footer_parts))
-
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return embed, BeerPagesView(
+            number, limit, beers[0], beers[-1], has_newer, has_older
+        )
 
     @app_commands.command(
         name="beer_delete", description="Delete a beer entry by its UUID"
@@ -131,8 +226,6 @@ class BeerTrackerCog(commands.Cog):
         beer_uuid="The UUID of the beer to delete",
     )
     async def beer_delete(self, interaction: discord.Interaction, beer_uuid: str):
-        db = self.bot.db
-
         # verify UUID format
         try:
             uuid.UUID(beer_uuid)
@@ -142,39 +235,17 @@ class BeerTrackerCog(commands.Cog):
             )
             return
 
-        # find which user owns this beer
-        user_data = await db.beer_tracker.find_one({"beers.id": beer_uuid})
-
-        if not user_data:
-            await interaction.response.send_message(
-                "❌ No beer found with that UUID!", ephemeral=True
-            )
-            return
-
-        # permission check
-        if user_data["user_id"] != interaction.user.id:
-            await interaction.response.send_message(
-                "❌ You can only delete your own beers!", ephemeral=True
-            )
-            return
-
-        # remove the beer entry
-        updated_beers = [b for b in user_data["beers"] if b["id"] != beer_uuid]
+        # deleted only if it's the user's own, in one round trip
+        deleted_beer = await self.beers.delete(beer_uuid, interaction.user.id)
 
-        try:
-            deleted_beer = next(b for b in user_data["beers"] if b["id"] == beer_uuid)
-        except StopIteration:
-            await interaction.response.send_message(
-                "❌ No beer found with that UUID!", ephemeral=True
-            )
+        if not deleted_beer:
+            if await self.beers.owner(beer_uuid) is None:
+                message = "❌ No beer found with that UUID!"
+            else:
+                message = "❌ You can only delete your own beers!"
+            await interaction.response.send_message(message, ephemeral=True)
             return
 
-        # update database
-        await db.beer_tracker.update_one(
-            {"user_id": user_data["user_id"]},
-            {"$set": {"beers": updated_beers, "total_beers": len(updated_beers)}},
-        )
-
         # build confirmation message
         beer_time = ts_to_prague_time(deleted_beer["timestamp"]).strftime(
             "%Y-%m-%d %H:%M"
@@ -200,35 +271,20 @@ class BeerTrackerCog(commands.Cog):
         period: Optional[Literal["day", "week", "month", "year"]] = None,
     ):
         target_user = user or interaction.user
-        db = self.bot.db
 
-        user_data = await db.beer_tracker.find_one({"user_id": target_user.id})
+        total = await self.beers.total(target_user.id)
 
-        if not user_data or not user_data["beers"]:
+        if not total:
             await interaction.response.send_message(
                 f"{target_user.mention} hasn't drunk any beers yet! 🚱"
             )
             return
 
-        # Filter beers by time period if specified
-        beers = user_data["beers"]
+        # period counts are kept with the user's summary
         if period:
-            now = datetime.now(prague_tz)
-            if period == "day":
-                cutoff = now - timedelta(days=1)
-            elif period == "week":
-                cutoff = now - timedelta(weeks=1)
-            elif period == "month":
-                cutoff = now - timedelta(days=30)
-            elif period == "year":
-                cutoff = now - timedelta(days=365)
-
-            filtered_beers = [
-                b for b in beers if ts_to_prague_time(b["timestamp"]) >= cutoff
-            ]
-            count = len(filtered_beers)
+            count = await self.beers.recent(target_user.id, period)
         else:
-            count = user_data["total_beers"]
+            count = total
             period = "all time"
 
         await interaction.response.send_message(
@@ -248,47 +304,26 @@ class BeerTrackerCog(commands.Cog):
         period: Optional[Literal["day", "week", "month", "year"]] = None,
         limit: Optional[app_commands.Range[int, 1, 30]] = 10,
     ):
-        db = self.bot.db
-        all_users = await db.beer_tracker.find().to_list(None)
+        cutoff = None
+        if period:
+            now = datetime.now(prague_tz)
+            if period == "day":
+                # cutoff is the start of today
+                cutoff = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            elif period == "week":
+                cutoff = now - timedelta(weeks=1)
+            elif period == "month":
+                cutoff = now - timedelta(days=30)
+            elif period == "year":
+                cutoff = now - timedelta(days=365)
 
-        if not all_users:
+        # [(user_id, count)], counted and sorted by the database
+        leaderboard = await self.beers.leaderboard(cutoff, limit)
+
+        if not leaderboard and not period:
             await interaction.response.send_message("No beers have been logged yet! 🚱")
             return
 
-        # Calculate beer counts for each user (filtering by period if needed)
-        leaderboard = []
-        for user_data in all_users:
-            if not user_data.get("beers"):
-                continue
-
-            if period:
-                now = datetime.now(prague_tz)
-                if period == "day":
-                    # cutoff is the start of today
-                    cutoff = now.replace(hour=0, minute=0, second=0, microsecond=0)
-                elif period == "week":
-                    cutoff = now - timedelta(weeks=1)
-                elif period == "month":
-                    cutoff = now - timedelta(days=30)
-                elif period == "year":
-                    cutoff = now - timedelta(days=365)
-
-                filtered_beers = [
-                    b
-                    for b in user_data["beers"]
-                    if ts_to_prague_time(b["timestamp"]) >= cutoff
-                ]
-                count = len(filtered_beers)
-            else:
-                count = user_data["total_beers"]
-
-            if count > 0:
-                leaderboard.append((user_data["username"], count, user_data["user_id"]))
-
-        # Sort by beer count (descending)
-        leaderboard.sort(key=lambda x: x[1], reverse=True)
-        leaderboard = leaderboard[:limit]
-
         if not leaderboard:
             await interaction.response.send_message(
                 f"No beers logged in the last {period}! 🚱"
@@ -302,7 +337,7 @@ class BeerTrackerCog(commands.Cog):
         )
 
         description = []
-        for idx, (_, count, user_id) in enumerate(leaderboard, 1):
+        for idx, (user_id, count) in enumerate(leaderboard, 1):
             description.append(f"**{idx}.** <@{user_id}> - **{count}** beers 🍻")
 
         embed.description = "\n".join(description)
@@ -316,19 +351,16 @@ class BeerTrackerCog(commands.Cog):
         self, interaction: discord.Interaction, user: Optional[discord.User] = None
     ):
         target_user = user or interaction.user
-        db = self.bot.db
 
-        # fetch user data
-        user_data = await db.beer_tracker.find_one({"user_id": target_user.id})
+        last_beer = await self.beers.last(target_user.id)
 
-        if not user_data or not user_data["beers"]:
+        if last_beer is None:
             await interaction.response.send_message(
                 f"{target_user.name} hasn't drunk any beers yet! 🚱"
             )
             return
 
-        last_beer = user_data["beers"][-1]
-        last_time = ts_to_prague_time(last_beer["timestamp"])
+        last_time = ts_to_prague_time(last_beer)
         now = datetime.now(prague_tz)
         time_diff = now - last_time
 
@@ -358,6 +390,58 @@ class BeerTrackerCog(commands.Cog):
             f"🍺 {target_user.name}'s last beer was **{time_str}** ({exact_time})"
         )
 
+    @app_commands.command(
+        name="beer_export", description="Export the beer logs as a CSV file"
+    )
+    @app_commands.describe(user="Only export this user's beers (defaults to everyone)")
+    async def beer_export(
+        self, interaction: discord.Interaction, user: Optional[discord.User] = None
+    ):
+        await interaction.response.defer()
+        user_id = user.id if user else None
+
+        # spooled to disk, the beers are never all in memory
+        with tempfile.TemporaryFile() as fp:
+            rows = await self.beers.export(fp, user_id)
+            if not rows:
+                await interaction.followup.send("No beers have been logged yet! 🚱")
+                return
+
+            if fp.tell() > interaction.guild.filesize_limit:
+                await interaction.followup.send(
+                    "❌ The export is too large to upload, try a single user."
+                )
+                return
+
+            weekdays, hours = await self.beers.histograms(user_id)
+            embed = discord.Embed(
+                title=f"🍺 Beer export ({user.name if user else 'everyone'}) 🍺",
+                description=f"{rows} beers, times are in Prague time",
+                color=discord.Color.gold(),
+            )
+            embed.add_field(
+                name="Per weekday", value=histogram(WEEKDAYS, weekdays), inline=False
+            )
+            embed.add_field(
+                name="Per hour",
+                value=histogram([str(hour) for hour in range(24)], hours),
+                inline=False,
+            )
+
+            fp.seek(0)
+            await interaction.followup.send(
+                embed=embed, file=discord.File(fp, filename="beers.csv.gz")
+            )
+
+    @app_commands.command(
+        name="beer_rebuild", description="Recount the beer stats from the logged beers"
+    )
+    @app_commands.checks.has_permissions(moderate_members=True)
+    async def beer_rebuild(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        await self.beers.rebuild_buckets()
+        await interaction.followup.send("✅ Beer stats rebuilt", ephemeral=True)
+
 
 async def setup(bot: BackroomsBot) -> None:
     await bot.add_cog(BeerTrackerCog(bot), guild=bot.backrooms)
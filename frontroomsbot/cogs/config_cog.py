@@ -47,5 +47,4 @@ class ConfigCommands(commands.Cog):
 
 
 async def setup(bot):
-    clear_cache()
     await bot.add_cog(ConfigCommands(bot), guild=bot.backrooms)
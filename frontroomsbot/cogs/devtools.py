@@ -1,7 +1,6 @@
 from bot import BackroomsBot
 from discord.ext import commands
 from consts import ERROR_WH
-import httpx
 from pathlib import Path
 import time
 
@@ -45,8 +44,7 @@ class DevTools(commands.Cog):
             "content": f"{self.bot.user} is up at <t:{int(time.time())}:T> using git: `{git_revision.strip()}`.",
             "allowed_mentions": {"parse": []},
         }
-        async with httpx.AsyncClient() as cl:
-            await cl.post(ERROR_WH, json=data)
+        await self.bot.http_pool.client(ERROR_WH).post(ERROR_WH, json=data)
 
 
 async def setup(bot):
@@ -177,6 +177,15 @@ class MakeReservationModal(Modal, title="Vytvorit rezervaci"):
 class EventsCog(commands.Cog):
     def __init__(self, bot: BackroomsBot) -> None:
         self.bot = bot
+        # message ids of the live events, reactions anywhere else are ignored
+        self.event_messages: set[int] = set()
+
+    async def cog_load(self) -> None:
+        db = self.bot.db
+        self.event_messages = {
+            event["message_id"]
+            async for event in db.events.find({}, {"_id": 0, "message_id": 1})
+        }
 
     async def get_user_events(
         self, user_id: int, limit: int = MAX_USER_EVENTS
@@ -261,6 +270,7 @@ class EventsCog(commands.Cog):
             },
         }
         await db.events.insert_one(event_data)
+        self.event_messages.add(message.id)
 
         await message.add_reaction("👍")
         await message.add_reaction("🤷")
@@ -371,6 +381,7 @@ class EventsCog(commands.Cog):
     ) -> None:
         db = self.bot.db
         await db.events.delete_one({"message_id": event["message_id"]})
+        self.event_messages.discard(event["message_id"])
 
         embed = discord.Embed(
             title="Event zrušen",
@@ -410,19 +421,19 @@ class EventsCog(commands.Cog):
 
         await interaction.response.defer(ephemeral=True)
 
+        client = self.bot.http_pool.client(RESERVATION_API_BASE_URL)
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.post(
-                    f"{RESERVATION_API_BASE_URL}/research_business",
-                    json={"prompt": place},
-                    headers={
-                        "Content-Type": "application/json",
-                        "Accept": "*/*",
-                        "x-magic": RESERVATION_AGENT_TOKEN or "",
-                    },
-                )
-                response.raise_for_status()
-                data = response.json()
+            response = await client.post(
+                f"{RESERVATION_API_BASE_URL}/research_business",
+                json={"prompt": place},
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept": "*/*",
+                    "x-magic": RESERVATION_AGENT_TOKEN or "",
+                },
+            )
+            response.raise_for_status()
+            data = response.json()
         except httpx.HTTPStatusError as e:
             await interaction.followup.send(
                 f"API vrátilo chybu: {e.response.status_code}", ephemeral=True
@@ -584,19 +595,19 @@ class EventsCog(commands.Cog):
             "personName": person_name,
         }
 
+        client = self.bot.http_pool.client(RESERVATION_API_BASE_URL)
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.post(
-                    f"{RESERVATION_API_BASE_URL}/make_reservation",
-                    json=payload,
-                    headers={
-                        "Content-Type": "application/json",
-                        "Accept": "*/*",
-                        "x-magic": RESERVATION_AGENT_TOKEN or "",
-                    },
-                )
-                response.raise_for_status()
-                data = response.json()
+            response = await client.post(
+                f"{RESERVATION_API_BASE_URL}/make_reservation",
+                json=payload,
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept": "*/*",
+                    "x-magic": RESERVATION_AGENT_TOKEN or "",
+                },
+            )
+            response.raise_for_status()
+            data = response.json()
         except httpx.HTTPStatusError as e:
             await interaction.followup.send(
                 f"Reservation API vratilo chybu: {e.response.status_code}",
@@ -686,17 +697,17 @@ class EventsCog(commands.Cog):
 
         await interaction.response.defer(ephemeral=True)
 
+        client = self.bot.http_pool.client(RESERVATION_API_BASE_URL)
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.get(
-                    f"{RESERVATION_API_BASE_URL}/conversation_details/{conversation_id}",
-                    headers={
-                        "Accept": "*/*",
-                        "x-magic": RESERVATION_AGENT_TOKEN or "",
-                    },
-                )
-                response.raise_for_status()
-                data = response.json()
+            response = await client.get(
+                f"{RESERVATION_API_BASE_URL}/conversation_details/{conversation_id}",
+                headers={
+                    "Accept": "*/*",
+                    "x-magic": RESERVATION_AGENT_TOKEN or "",
+                },
+            )
+            response.raise_for_status()
+            data = response.json()
         except httpx.HTTPStatusError as e:
             await interaction.followup.send(
                 f"Conversation API vratilo chybu: {e.response.status_code}",
@@ -840,6 +851,8 @@ class EventsCog(commands.Cog):
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        if payload.message_id not in self.event_messages:
+            return
         if payload.user_id == self.bot.user.id:
             return
 
@@ -854,6 +867,7 @@ class EventsCog(commands.Cog):
         db = self.bot.db
         event = await db.events.find_one({"message_id": payload.message_id})
         if event is None:
+            self.event_messages.discard(payload.message_id)
             return
 
         emoji = payload.emoji.name
@@ -885,6 +899,8 @@ class EventsCog(commands.Cog):
 
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        if payload.message_id not in self.event_messages:
+            return
         if payload.user_id == self.bot.user.id:
             return
 
@@ -899,6 +915,7 @@ class EventsCog(commands.Cog):
         db = self.bot.db
         event = await db.events.find_one({"message_id": payload.message_id})
         if event is None:
+            self.event_messages.discard(payload.message_id)
             return
 
         emoji = payload.emoji.name
@@ -1,11 +1,11 @@
 import discord
 from discord import app_commands
-import httpx
 import re
 import asyncio
 
+
 from bot import BackroomsBot
-from ._config import ConfigCog, Cfg
+from ._config import ConfigCog, ConfigSnapshot, Cfg
 from discord import Interaction
 
 START_HEADER_ID = "<|start_header_id|>"
@@ -31,6 +31,20 @@ class ImitationCog(ConfigCog):
         self.bot = bot
         self.lock = asyncio.Lock()
         self.context = ""
+        # the completion endpoint, rebuilt when `server` changes
+        self.endpoint: str | None = None
+        self.subscribe(self.configure)
+
+    async def cog_load(self):
+        await self.configure(self.snapshot)
+
+    async def configure(self, cfg: ConfigSnapshot):
+        try:
+            url = f"{cfg.server}/completion"
+        except KeyError:
+            self.endpoint = None
+        else:
+            self.endpoint = url
 
     async def user_autocomplete(self, interaction: Interaction, current: str):
         authors = [
@@ -212,12 +226,12 @@ class ImitationCog(ConfigCog):
             "cache_prompt": True,  # Existing context won't have to be evaluated again
         }
 
-        async with httpx.AsyncClient() as ac:
-            response = await ac.post(
-                f"{await self.server}/completion",
-                json=data,
-                timeout=await self.req_timeout,
-            )
+        if self.endpoint is None:
+            raise KeyError("server is not configured")
+        client = self.bot.http_pool.client(self.endpoint)
+        response = await client.post(
+            self.endpoint, json=data, timeout=self.snapshot.req_timeout
+        )
         json = response.json()
 
         if response.status_code != 200:
@@ -1,32 +1,170 @@
+from typing import Awaitable, Callable
 import discord
 from discord.ext import commands
+from discord import app_commands
 import httpx
 
 from bot import BackroomsBot
 from consts import GEMINI_TOKEN, GROQ_TOKEN
-from ._config import ConfigCog, Cfg
+from ._config import ConfigCog, ConfigSnapshot, Cfg
+from .utils.llm_cache import ResponseCache
+from .utils.llm_router import Router, parse_routes
+from .utils.llm_scheduler import ProviderScheduler, QueueFullError
+from .utils.llm_stream import MESSAGE_LIMIT, StreamingReply, iter_sse
+from .utils.message_cache import CachedMessage, MessageCache
+
+GEMINI_MODEL = "gemini-pro"
+LLAMA_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+GPT_OSS_MODEL = "openai/gpt-oss-120b"
+REASONING_MODEL = "deepseek-r1-distill-llama-70b"
+
+# which provider's quota each model counts against
+PROVIDERS = {
+    GEMINI_MODEL: "gemini",
+    LLAMA_MODEL: "groq",
+    GPT_OSS_MODEL: "groq",
+    REASONING_MODEL: "groq",
+}
+
+GEMINI_API_URL = (
+    f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}"
+)
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+# called with every piece of text as it streams in
+OnText = Callable[[str], Awaitable[None]] | None
+
+
+LLM_SUFFIXES = ("??", "?!", "?.", "?r")
 
 
 def replace_suffix(message: discord.Message, suffix: str) -> str:
     return message.content[: -len(suffix)] + "?"
 
 
+def strip_llm_suffix(content: str) -> str:
+    for suffix in LLM_SUFFIXES:
+        if content.endswith(suffix):
+            return content[: -len(suffix)] + "?"
+    return content
+
+
+def estimate_tokens(content: str) -> int:
+    # the models have different tokenizers, budget conservatively with fewer
+    # characters per token than the usual four of english text
+    return len(content) // 3 + 1
+
+
+def gemini_text(event: dict) -> str:
+    """
+    The text of the first candidate, empty for chunks without any, like the final
+    one with just the `finishReason` or a safety block
+    """
+    candidates = event.get("candidates") or [{}]
+    parts = candidates[0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+
 class TolerableLLMError(Exception):
     """An error that won't be logged, only sent to the user"""
 
     pass
 
 
+# errors after which the request is retried with a fallback model
+FAILOVER_ERRORS = (
+    httpx.HTTPError,
+    KeyError,
+    IndexError,
+    ValueError,
+    TolerableLLMError,
+    RuntimeError,
+    QueueFullError,
+)
+
+
 class LLMCog(ConfigCog):
     proxy_url = Cfg(str)
     botroom_id = Cfg(int, default=1187163442814128128)
     req_timeout = Cfg(int, default=30)
+    stream_responses = Cfg(int, default=1)
+    stream_edit_interval = Cfg(float, default=1.5)
+    cache_size = Cfg(int, default=256)
+    cache_ttl = Cfg(int, default=3600)
+    cache_mongo = Cfg(int, default=0)
+    # comma separated, e.g. `gemini-pro,openai/gpt-oss-120b`
+    cache_disabled_models = Cfg(str, default="")
+    context_max_turns = Cfg(int, default=20)
+    context_max_tokens = Cfg(int, default=8000)
+    message_cache_size = Cfg(int, default=2048)
+    gemini_max_in_flight = Cfg(int, default=2)
+    gemini_rpm = Cfg(int, default=15)
+    groq_max_in_flight = Cfg(int, default=4)
+    groq_rpm = Cfg(int, default=30)
+    max_queued = Cfg(int, default=10)
+    # `model>fallback>fallback;model>fallback`
+    fallback_routes = Cfg(str, default=f"{GEMINI_MODEL}>{LLAMA_MODEL}")
+    hedge_requests = Cfg(int, default=0)
 
     def __init__(self, bot: BackroomsBot) -> None:
         super().__init__(bot)
+        self.cache = ResponseCache()
+        self.messages = MessageCache()
+        self.schedulers = {
+            "gemini": ProviderScheduler(),
+            "groq": ProviderScheduler(),
+        }
+        self.router = Router(FAILOVER_ERRORS)
+        self.routes = parse_routes(LLMCog.fallback_routes.default)
+        self.uncached_models: set[str] = set()
+        # the settings the cache and the schedulers were built with
+        self.cache_settings: tuple | None = None
+        self.scheduler_settings: dict[str, tuple] = {}
+        self.subscribe(self.configure)
+        self.handlers = {
+            GEMINI_MODEL: self.handle_google_gemini,
+            LLAMA_MODEL: self.handle_llama,
+            GPT_OSS_MODEL: self.handle_gpt_oss,
+            REASONING_MODEL: self.handle_reasoning,
+        }
 
-    async def handle_google_gemini(self, conversation: list[dict]):
-        API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent?key={GEMINI_TOKEN}"
+    async def cog_load(self):
+        await self.configure(self.snapshot)
+
+    async def configure(self, cfg: ConfigSnapshot):
+        """Rebuild the state derived from the configuration, called again on every change"""
+        cache_settings = (cfg.cache_size, cfg.cache_ttl, bool(cfg.cache_mongo))
+        if cache_settings != self.cache_settings:
+            collection = self.bot.db.llm_cache if cfg.cache_mongo else None
+            self.cache = ResponseCache(cfg.cache_size, cfg.cache_ttl, collection)
+            await self.cache.ensure_indexes()
+            self.cache_settings = cache_settings
+        self.messages.max_entries = cfg.message_cache_size
+
+        scheduler_settings = {
+            "gemini": (cfg.gemini_max_in_flight, cfg.gemini_rpm, cfg.max_queued),
+            "groq": (cfg.groq_max_in_flight, cfg.groq_rpm, cfg.max_queued),
+        }
+        for provider, settings in scheduler_settings.items():
+            if settings != self.scheduler_settings.get(provider):
+                # requests in flight finish in the old scheduler
+                max_in_flight, rpm, max_queued = settings
+                self.schedulers[provider] = ProviderScheduler(
+                    max_in_flight, rpm, max_queued=max_queued
+                )
+                self.scheduler_settings[provider] = settings
+
+        self.routes = parse_routes(cfg.fallback_routes)
+        self.uncached_models = {
+            model.strip() for model in cfg.cache_disabled_models.split(",")
+        }
+
+    def cache_enabled(self, model: str) -> bool:
+        return model not in self.uncached_models
+
+    async def handle_google_gemini(
+        self, conversation: list[dict], on_text: OnText = None
+    ):
         # Convert conversation to the format required by the API
         conversation = [
             {
@@ -54,121 +192,346 @@ class LLMCog(ConfigCog):
             ],
         }
         # US socks5 proxy, because API allows only some regions
-        proxy = await self.proxy_url
-        async with httpx.AsyncClient(proxy=proxy, verify=False) as ac:
-            response = await ac.post(API_URL, json=data, timeout=await self.req_timeout)
-        json = response.json()
+        proxy = self.snapshot.proxy_url
+        client = self.bot.http_pool.client(GEMINI_API_URL, proxy=proxy, verify=False)
+        if on_text is None:
+            API_URL = f"{GEMINI_API_URL}:generateContent?key={GEMINI_TOKEN}"
+            response = await client.post(
+                API_URL, json=data, timeout=self.snapshot.req_timeout
+            )
+            json = response.json()
+            self.check_gemini_response(response, json)
+            if not (text := gemini_text(json)):
+                raise KeyError("empty response")
+            return text
+
+        API_URL = f"{GEMINI_API_URL}:streamGenerateContent?alt=sse&key={GEMINI_TOKEN}"
+        text = []
+        async with client.stream(
+            "POST", API_URL, json=data, timeout=self.snapshot.req_timeout
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                self.check_gemini_response(response, response.json())
+            async for event in iter_sse(response):
+                delta = gemini_text(event)
+                if delta:
+                    text.append(delta)
+                    await on_text(delta)
+        return "".join(text)
+
+    @staticmethod
+    def check_gemini_response(response: httpx.Response, json: dict):
         if response.status_code == 200:
-            return json["candidates"][0]["content"]["parts"][0]["text"]
+            return
         elif response.status_code == 500:
             raise TolerableLLMError(json["error"]["message"])
         else:
             raise RuntimeError(f"Gemini failed {response.status_code}: {json}")
 
-    async def handle_groq(self, model, conversation: list[dict], system_prompt=True):
-        API_URL = "https://api.groq.com/openai/v1/chat/completions"
+    async def handle_groq(
+        self,
+        model,
+        conversation: list[dict],
+        system_prompt=True,
+        on_text: OnText = None,
+    ):
         data = {
             "messages": conversation,
             "model": model,
         }
 
         if system_prompt:
-            data["messages"].insert(
-                0,
+            data["messages"] = [
                 {
                     "role": "system",
                     "content": "Jsi digitální asistent, který odpovídá v češtině",
                 },
-            )
+                *conversation,
+            ]
 
         headers = {
             "Authorization": f"Bearer {GROQ_TOKEN}",
             "Content-Type": "application/json",
         }
-        async with httpx.AsyncClient() as ac:
-            response = await ac.post(
-                API_URL, json=data, headers=headers, timeout=await self.req_timeout
+        client = self.bot.http_pool.client(GROQ_API_URL)
+        if on_text is None:
+            response = await client.post(
+                GROQ_API_URL,
+                json=data,
+                headers=headers,
+                timeout=self.snapshot.req_timeout,
             )
-        json = response.json()
-        if response.status_code == 200:
+            json = response.json()
+            if response.status_code != 200:
+                raise RuntimeError(f"Groq failed {response.status_code}: {json}")
             return json["choices"][0]["message"]["content"]
-        else:
-            raise RuntimeError(f"Groq failed {response.status_code}: {json}")
 
-    async def handle_llama(self, conversation: list[dict]):
+        data["stream"] = True
+        text = []
+        async with client.stream(
+            "POST",
+            GROQ_API_URL,
+            json=data,
+            headers=headers,
+            timeout=self.snapshot.req_timeout,
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise RuntimeError(
+                    f"Groq failed {response.status_code}: {response.json()}"
+                )
+            async for event in iter_sse(response):
+                delta = event["choices"][0]["delta"].get("content")
+                if delta:
+                    text.append(delta)
+                    await on_text(delta)
+        return "".join(text)
+
+    async def handle_llama(self, conversation: list[dict], on_text: OnText = None):
         return await self.handle_groq(
-            "meta-llama/llama-4-scout-17b-16e-instruct",
+            LLAMA_MODEL,
             conversation,
             system_prompt=False,
+            on_text=on_text,
         )
 
-    async def handle_gpt_oss(self, conversation: list[dict]):
+    async def handle_gpt_oss(self, conversation: list[dict], on_text: OnText = None):
         return await self.handle_groq(
-            "openai/gpt-oss-120b", conversation, system_prompt=False
+            GPT_OSS_MODEL,
+            conversation,
+            system_prompt=False,
+            on_text=on_text,
         )
 
-    async def handle_reasoning(self, conversation: list[dict]):
+    async def handle_reasoning(self, conversation: list[dict], on_text: OnText = None):
         return await self.handle_groq(
-            "deepseek-r1-distill-llama-70b", conversation, system_prompt=False
+            REASONING_MODEL,
+            conversation,
+            system_prompt=False,
+            on_text=on_text,
         )
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         suffix_map = {
-            "??": self.handle_google_gemini,
-            "?!": self.handle_llama,
-            "?.": self.handle_gpt_oss,
-            "?r": self.handle_reasoning,
+            "??": GEMINI_MODEL,
+            "?!": LLAMA_MODEL,
+            "?.": GPT_OSS_MODEL,
+            "?r": REASONING_MODEL,
         }
 
         if message.channel.id != await self.botroom_id:
             return
         if message.author == self.bot.user:
             return
-        for suffix, handler in suffix_map.items():
+        self.remember(message)
+        for suffix, model in suffix_map.items():
             if message.content.endswith(suffix):
-                conversation = []
-                # If the message is a reply to AI, get the original message and add it to the prompt
-                if (
-                    message.reference
-                    and message.reference.resolved
-                    and message.reference.resolved.author == self.bot.user
-                ):
-                    ai_msg = message.reference.resolved
-                    user_msg_id = message.reference.resolved.reference.message_id
-                    user_msg = await message.channel.fetch_message(user_msg_id)
-                    # User question
-                    conversation.append(
-                        {"role": "user", "content": replace_suffix(user_msg, suffix)}
-                    )
-                    # AI answer
-                    conversation.append(
-                        {"role": "assistant", "content": ai_msg.content}
-                    )
-
-                conversation.append(
-                    {"role": "user", "content": replace_suffix(message, suffix)}
+                conversation = await self.build_conversation(message, suffix)
+                await self.respond(message, model, conversation)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        entry = self.messages.get(payload.message_id)
+        # answers hold the whole response, not just the edited chunk
+        if entry is not None and not entry.from_bot and "content" in payload.data:
+            self.messages.update_content(payload.message_id, payload.data["content"])
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.messages.discard(payload.message_id)
+
+    def remember(self, message: discord.Message, content: str | None = None):
+        """Add a message to the reply chain cache"""
+        self.messages.add(
+            CachedMessage(
+                id=message.id,
+                content=message.content if content is None else content,
+                from_bot=message.author == self.bot.user,
+                reference_id=message.reference.message_id
+                if message.reference
+                else None,
+            )
+        )
+
+    async def get_cached_message(
+        self, channel: discord.abc.Messageable, message_id: int
+    ) -> CachedMessage | None:
+        """Get a message from the reply chain cache, fetching it on a miss"""
+        if (entry := self.messages.get(message_id)) is not None:
+            return entry
+        try:
+            message = await channel.fetch_message(message_id)
+        except (discord.NotFound, discord.Forbidden):
+            return None
+        self.remember(message)
+        return self.messages.get(message_id)
+
+    async def build_conversation(
+        self, message: discord.Message, suffix: str
+    ) -> list[dict]:
+        """
+        Build the conversation by walking the reply chain of `message`.
+
+        The oldest turns are left out once the turn or token budget is exceeded.
+        """
+        max_turns = await self.context_max_turns
+        budget = await self.context_max_tokens
+
+        content = replace_suffix(message, suffix)
+        turns = [{"role": "user", "content": content}]
+        used = estimate_tokens(content)
+
+        reference_id = message.reference.message_id if message.reference else None
+        resolved = message.reference.resolved if message.reference else None
+        if isinstance(resolved, discord.Message) and not self.messages.get(resolved.id):
+            self.remember(resolved)
+
+        while reference_id is not None and len(turns) < max_turns:
+            entry = await self.get_cached_message(message.channel, reference_id)
+            if entry is None:
+                break
+            if entry.from_bot:
+                turn = {"role": "assistant", "content": entry.content}
+            else:
+                turn = {"role": "user", "content": strip_llm_suffix(entry.content)}
+            used += estimate_tokens(turn["content"])
+            if used > budget:
+                break
+            turns.append(turn)
+            reference_id = entry.reference_id
+
+        # the APIs expect alternating turns, starting with the user
+        conversation: list[dict] = []
+        for turn in reversed(turns):
+            if not conversation and turn["role"] == "assistant":
+                continue
+            if conversation and conversation[-1]["role"] == turn["role"]:
+                conversation[-1]["content"] += "\n\n" + turn["content"]
+            else:
+                conversation.append(turn)
+        return conversation
+
+    async def respond(
+        self, message: discord.Message, model: str, conversation: list[dict]
+    ):
+        """
+        Answer `message` using the model or its fallbacks, streaming the response if enabled
+        """
+        allowed = discord.AllowedMentions(
+            roles=False, everyone=False, users=True, replied_user=True
+        )
+
+        if self.cache_enabled(model):
+            cached = await self.cache.get(model, conversation)
+            if cached is not None:
+                for answer in await self.send_chunks(message, cached, allowed):
+                    self.remember(answer, cached)
+                return
+
+        reply = None
+        if await self.stream_responses:
+            reply = StreamingReply(
+                message, await self.stream_edit_interval, allowed_mentions=allowed
+            )
+        notice = None
+        # whether the answer or an error was shown in place of the placeholders
+        done = False
+
+        async def send_error(error: str):
+            nonlocal done
+            done = True
+            if reply is not None:
+                await reply.fail(error)
+            elif notice is not None:
+                await notice.edit(content=error)
+            else:
+                await message.reply(error)
+
+        async def on_queued(position: int):
+            nonlocal notice
+            queued = f"*queued (position {position})*"
+            if reply is None:
+                notice = notice or await message.reply(queued)
+            elif reply.replies:
+                await reply.set_placeholder(queued)
+            else:
+                await reply.start(queued)
+
+        async def call(model: str, on_text) -> str:
+            nonlocal notice
+            scheduler = self.schedulers[PROVIDERS[model]]
+            async with scheduler.slot(message.author.id, on_queued):
+                if reply is not None and reply.replies:
+                    await reply.set_placeholder()
+                if notice is not None:
+                    shown, notice = notice, None
+                    await shown.delete()
+                return await self.handlers[model](conversation, on_text=on_text)
+
+        models = [model, *self.routes.get(model, [])]
+        try:
+            if reply is not None:
+                await reply.start()
+                answered_by, response = await self.router.run(
+                    models, call, reply.push, hedge=bool(self.snapshot.hedge_requests)
                 )
+                if not response:
+                    raise KeyError("empty response")
+                await reply.finish()
+                sent = reply.replies
+            else:
+                answered_by, response = await self.router.run(
+                    models, call, hedge=bool(self.snapshot.hedge_requests)
+                )
+                sent = await self.send_chunks(message, response, allowed)
+            done = True
+            for answer in sent:
+                # every chunk stands for the whole answer in follow-up conversations
+                self.remember(answer, response)
+            # a fallback's answer is cached as its own, not the requested model's
+            if self.cache_enabled(answered_by):
+                await self.cache.put(answered_by, conversation, response)
+        except QueueFullError:
+            await send_error("*Too many requests right now, try again later*")
+        except httpx.ReadTimeout:
+            await send_error("*Response timed out*")
+        except httpx.HTTPError as e:
+            await send_error(f"*Request failed: {type(e).__name__}*")
+        except (KeyError, IndexError, ValueError):
+            # ValueError covers malformed JSON in the response
+            await send_error("*Did not get a response*")
+        except TolerableLLMError as e:
+            await send_error(f"*{str(e)}*")
+        except RuntimeError as e:
+            await send_error(f"*{str(e)}*")
+            raise RuntimeError(e)
+        finally:
+            if not done:
+                # never leave the placeholder or the queue notice on screen
+                await send_error("*Something went wrong*")
+
+    async def send_chunks(
+        self,
+        message: discord.Message,
+        response: str,
+        allowed: discord.AllowedMentions,
+    ) -> list[discord.Message]:
+        chunks = [
+            response[i : i + MESSAGE_LIMIT]
+            for i in range(0, len(response), MESSAGE_LIMIT)
+        ]
+        return [
+            await message.reply(chunk, allowed_mentions=allowed) for chunk in chunks
+        ]
 
-                try:
-                    response = await handler(conversation)
-                    allowed = discord.AllowedMentions(
-                        roles=False, everyone=False, users=True, replied_user=True
-                    )
-                    chunks = [
-                        response[i : i + 2000] for i in range(0, len(response), 2000)
-                    ]
-                    for chunk in chunks:
-                        await message.reply(chunk, allowed_mentions=allowed)
-                except httpx.ReadTimeout:
-                    await message.reply("*Response timed out*")
-                except (KeyError, IndexError):
-                    await message.reply("*Did not get a response*")
-                except TolerableLLMError as e:
-                    await message.reply(f"*{str(e)}*")
-                except RuntimeError as e:
-                    await message.reply(f"*{str(e)}*")
-                    raise RuntimeError(e)
+    @app_commands.command(
+        name="llm_cache_stats", description="Show the LLM response cache counters"
+    )
+    async def llm_cache_stats(self, interaction: discord.Interaction):
+        stats = [f"{name}: **{value}**" for name, value in self.cache.stats().items()]
+        await interaction.response.send_message("\n".join(stats), ephemeral=True)
 
 
 async def setup(bot: BackroomsBot) -> None:
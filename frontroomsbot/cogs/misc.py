@@ -1,7 +1,6 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import httpx
 
 from bot import BackroomsBot
 
@@ -34,8 +33,7 @@ class MiscellaneousCog(commands.Cog):
         if date is not None:
             uri += f"/{date}"
 
-        async with httpx.AsyncClient() as ac:
-            response = await ac.get(uri)
+        response = await self.bot.http_pool.client(uri).get(uri)
 
         if response.status_code == 200:
             json = response.json()
@@ -49,12 +49,13 @@ class ReactionUtilsCog(ConfigCog):
         :param channel: Channel where the message is
         :return:
         """
+        pin_count = self.snapshot.pin_count
         for react in message.reactions:
             if (
                 react.emoji == "📌"
                 and not message.pinned
                 and not message.is_system()
-                and react.count >= await self.pin_count
+                and react.count >= pin_count
             ):
                 # FIXME
                 # pins = await channel.pins()
@@ -75,12 +76,12 @@ class ReactionUtilsCog(ConfigCog):
                 react.emoji == "🔇"
                 and not author.is_timed_out()
                 and not message.is_system()
-                and react.count >= await self.timeout_count
+                and react.count >= self.snapshot.timeout_count
             ):
                 # FIXME
                 # we need to maintain when was the last timeout,
                 # otherwise someone could get locked out
-                duration = datetime.timedelta(minutes=await self.timeout_duration)
+                duration = datetime.timedelta(minutes=self.snapshot.timeout_duration)
                 await author.timeout(duration)
                 break
 
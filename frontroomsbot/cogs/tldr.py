@@ -1,20 +1,23 @@
 import discord
 from discord import (
     app_commands,
-    MessageType,
     TextChannel,
     Message,
     Interaction,
     AppCommandType,
 )
+from discord.ext import commands
 from bot import BackroomsBot
-import google.generativeai as genai
-import re
-import json
+import asyncio
 from collections import defaultdict
+from itertools import groupby
 from ._config import Cfg, ConfigCog
-
-from consts import GEMINI_TOKEN
+from .utils.archive import channel_history
+from .utils.gemini import gemini
+from .utils.mentions import MentionResolver
+from .utils.summary_cache import WindowSummaryCache
+from .utils.token_estimator import TokenEstimator, estimator
+from .utils.transcript import render_transcript
 
 
 class TldrError(Exception):
@@ -45,15 +48,28 @@ class TldrCog(ConfigCog):
     GEMINI_MODEL_NAME = Cfg(str, "gemini-1.5-flash")
     TOKEN_LIMIT = Cfg(int, 100_000)
     MESSAGES_LIMIT = Cfg(int, 10_000)
+    REQ_TIMEOUT = Cfg(int, 60)
+    # conversations are summarized in windows of messages sent within the same period
+    WINDOW_MINUTES = Cfg(int, 360)
+    # and of at most this size
+    WINDOW_TOKENS = Cfg(int, 30_000)
+    MAP_CONCURRENCY = Cfg(int, 4)
+    # calibrated token estimator weights, see benchmarks/token_estimator.py
+    TOKEN_ESTIMATOR = Cfg(str, "")
+    # how long resolved user names are cached, in seconds
+    MENTION_CACHE_TTL = Cfg(int, 3600)
+    MENTION_FETCH_CONCURRENCY = Cfg(int, 5)
 
     def __init__(self, bot: BackroomsBot) -> None:
         super().__init__(bot)
         self.bot = bot
-        genai.configure(api_key=GEMINI_TOKEN)
         # { (user_id, channel_id): [message_after, message_before] }
         self.boundaries: defaultdict[
             tuple[int, int], list[Message | None]
         ] = defaultdict(lambda: [None, None])
+        self.mentions = MentionResolver(bot)
+        self.windows = WindowSummaryCache(self.bot.db.tldr_windows)
+        self.estimator = estimator
 
         # Register the context menu commands
         self.ctx_menu_tldr_after = app_commands.ContextMenu(
@@ -84,6 +100,16 @@ class TldrCog(ConfigCog):
         self.bot.tree.add_command(self.ctx_menu_tldr_before)
         self.bot.tree.add_command(self.ctx_menu_tldr_this)
 
+    async def cog_load(self) -> None:
+        self.mentions = MentionResolver(
+            self.bot,
+            ttl=await self.MENTION_CACHE_TTL,
+            max_concurrency=await self.MENTION_FETCH_CONCURRENCY,
+        )
+        await self.windows.ensure_indexes()
+        if spec := await self.TOKEN_ESTIMATOR:
+            self.estimator = TokenEstimator.parse(spec)
+
     @app_commands.command(
         name="tldr",
         description="Vytvoří krátký souhrn mezi zprávami. Je nutné nastavit začátek.",
@@ -119,6 +145,8 @@ class TldrCog(ConfigCog):
             await respond(tldr)
         except TldrError as e:
             await respond(e.error_msg)
+        except TimeoutError:
+            await respond("Gemini did not respond in time.")
         except Exception as e:
             await respond("An unexpected error occurred.")
             raise e
@@ -145,8 +173,8 @@ class TldrCog(ConfigCog):
         self, interaction: Interaction, message: Message
     ):
         await interaction.response.defer(ephemeral=self.EPHEMERAL)
-        msg_content = await self._replace_user_mentions_with_their_names(
-            message.content
+        [msg_content] = await self.mentions.replace_mentions(
+            [message.content], message.guild
         )
         tldr = await self._generate_tldr_from_single_message(msg_content)
         await interaction.followup.send(tldr, ephemeral=self.EPHEMERAL)
@@ -157,6 +185,25 @@ class TldrCog(ConfigCog):
         self.bot.tree.remove_command(self.ctx_menu_tldr_before)
         self.bot.tree.remove_command(self.ctx_menu_tldr_this)
 
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        # bot messages are edited all the time (e.g. streamed LLM answers), their
+        # edits don't invalidate summaries
+        if payload.data.get("author", {}).get("bot"):
+            return
+        if "content" in payload.data:
+            await self.windows.invalidate(payload.channel_id, [payload.message_id])
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        await self.windows.invalidate(payload.channel_id, [payload.message_id])
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(
+        self, payload: discord.RawBulkMessageDeleteEvent
+    ):
+        await self.windows.invalidate(payload.channel_id, list(payload.message_ids))
+
     async def _get_last_message(self, channel: TextChannel) -> Message:
         # try to get the last message in the channel from cache
         message_before = channel.last_message
@@ -166,35 +213,170 @@ class TldrCog(ConfigCog):
         async for msg in channel.history(limit=1):
             return msg
 
-    async def _generate_tldr_from_conversation(self, messages: str) -> str:
-        model = genai.GenerativeModel(await self.GEMINI_MODEL_NAME)
-        tokens = model.count_tokens(messages)
-        if tokens.total_tokens > await self.TOKEN_LIMIT:
+    async def _count_tokens(self, model_name: str, content: str) -> tuple[bool, int]:
+        """Whether the content fits into `TOKEN_LIMIT` and its (estimated) size"""
+        limit = await self.TOKEN_LIMIT
+        fits = self.estimator.fits(content, limit)
+        tokens = self.estimator.estimate(content)
+        if fits is None:
+            # too close to the limit to trust the estimate, ask Gemini
+            tokens = await gemini.count_tokens(
+                model_name, content, timeout=await self.REQ_TIMEOUT
+            )
+            fits = tokens <= limit
+        return fits, tokens
+
+    async def _check_token_limit(self, model_name: str, content: str):
+        fits, tokens = await self._count_tokens(model_name, content)
+        if not fits:
             raise TokensLimitExceededError(
-                f"Input exceeds the token limit: {await self.TOKEN_LIMIT}, total tokens: {tokens.total_tokens}."
+                f"Input exceeds the token limit: {await self.TOKEN_LIMIT}, total tokens: {tokens}."
             )
+
+    async def _generate_tldr_from_conversation(
+        self, channel_id: int, messages: list[dict]
+    ) -> str:
+        """
+        Summarize the conversation window by window and reduce the partial summaries.
+
+        Windows are aligned to `WINDOW_MINUTES` long periods, so overlapping ranges share
+        them, and their summaries are cached. Only windows that were not summarized
+        before (usually just the tail of the conversation) are sent to Gemini.
+        A conversation with nothing cached that fits into `TOKEN_LIMIT` is summarized
+        in a single request instead, its completed windows are summarized alongside
+        so that later overlapping ranges can reuse them.
+        """
+        if not messages:
+            raise TldrError("There are no messages to summarize.")
+        model_name = await self.GEMINI_MODEL_NAME
+        windows = self._plan_windows(
+            messages, await self.WINDOW_TOKENS, await self.WINDOW_MINUTES
+        )
+        keys = [(window[0]["id"], window[-1]["id"]) for window in windows]
+        cached = await self.windows.get_many(channel_id, model_name, keys)
+        semaphore = asyncio.Semaphore(await self.MAP_CONCURRENCY)
+
+        async def summarize_window(window: list[dict]) -> str:
+            transcript = render_transcript(window)
+            await self._check_token_limit(model_name, transcript)
+            prompt = (
+                "You are given a part of a Discord conversation. Summarize the main "
+                "points and key ideas of this part in a concise manner in Czech. Keep the "
+                "names of the people involved.\n\n"
+                f"Conversation part:\n{transcript}"
+            )
+            async with semaphore:
+                return await gemini.generate(
+                    model_name, prompt, timeout=await self.REQ_TIMEOUT
+                )
+
+        if len(windows) > 1 and not cached:
+            transcript = render_transcript(messages)
+            fits, _ = await self._count_tokens(model_name, transcript)
+            if fits:
+                prompt = (
+                    "You are given a Discord conversation. Summarize the main points "
+                    "and key ideas in a concise manner in Czech. Focus on the most "
+                    "important information and provide a clear and coherent summary."
+                    f"\n\nConversation:\n{transcript}"
+                )
+                # the last window is where later messages land, the others are done
+                summary, *completed = await asyncio.gather(
+                    gemini.generate(model_name, prompt, timeout=await self.REQ_TIMEOUT),
+                    *(summarize_window(window) for window in windows[:-1]),
+                )
+                await self.windows.put_many(
+                    channel_id, model_name, dict(zip(keys, completed))
+                )
+                return summary
+
+        missing = [(key, w) for key, w in zip(keys, windows) if key not in cached]
+        fresh = await asyncio.gather(*(summarize_window(w) for _, w in missing))
+        fresh = {key: summary for (key, _), summary in zip(missing, fresh)}
+        await self.windows.put_many(channel_id, model_name, fresh)
+
+        partials = [cached.get(key) or fresh[key] for key in keys]
+        if len(partials) == 1:
+            return partials[0]
+        return await self._reduce_summaries(
+            model_name, partials, await self.WINDOW_TOKENS
+        )
+
+    def _plan_windows(
+        self, messages: list[dict], window_tokens: int, window_minutes: int
+    ) -> list[list[dict]]:
+        """
+        Group the messages by the period they were sent in, periods with
+        more than `window_tokens` tokens are split further
+        """
+        period = window_minutes * 60 * 1000
+
+        def period_of(msg: dict) -> int:
+            # the snowflake starts with the milliseconds since the discord epoch
+            return (msg["id"] >> 22) // period
+
+        windows = []
+        for _, group in groupby(messages, key=period_of):
+            group = list(group)
+            split = self._split_into_windows(
+                [f"{msg['author']}: {msg['message']}" for msg in group], window_tokens
+            )
+            for window in split:
+                windows.append(group[: len(window)])
+                group = group[len(window) :]
+        return windows
+
+    async def _reduce_summaries(
+        self, model_name: str, summaries: list[str], window_tokens: int
+    ) -> str:
+        """Combine summaries of consecutive conversation parts into one"""
+        parts = [f"Part {i}:\n{summary}" for i, summary in enumerate(summaries, 1)]
+        windows = self._split_into_windows(parts, window_tokens)
+        if 1 < len(windows) < len(parts):
+            # too many partial summaries for one request, reduce them in steps
+            reduced = await asyncio.gather(
+                *(
+                    self._reduce_summaries(model_name, window, window_tokens)
+                    for window in windows
+                )
+            )
+            return await self._reduce_summaries(model_name, reduced, window_tokens)
         prompt = (
-            "You are given a Discord conversation. Summarize the main points and key ideas "
-            "in a concise manner in Czech. Focus on the most important information and provide "
-            "a clear and coherent summary.\n\n"
-            f"Conversation:\n{messages}"
+            "You are given summaries of consecutive parts of a Discord conversation. "
+            "Combine them into a single concise summary in Czech. Focus on the most "
+            "important information and provide a clear and coherent summary.\n\n"
+            + "\n\n".join(parts)
         )
-        return model.generate_content(prompt).text
+        return await gemini.generate(model_name, prompt, timeout=await self.REQ_TIMEOUT)
+
+    def _estimate_tokens(self, text: str) -> int:
+        return self.estimator.estimate(text)
+
+    def _split_into_windows(
+        self, items: list[str], window_tokens: int
+    ) -> list[list[str]]:
+        """Split consecutive items into windows of at most `window_tokens` tokens each"""
+        windows: list[list[str]] = [[]]
+        used = 0
+        for item in items:
+            tokens = self._estimate_tokens(item)
+            if windows[-1] and used + tokens > window_tokens:
+                windows.append([])
+                used = 0
+            windows[-1].append(item)
+            used += tokens
+        return windows
 
     async def _generate_tldr_from_single_message(self, message: str) -> str:
-        model = genai.GenerativeModel(await self.GEMINI_MODEL_NAME)
-        tokens = model.count_tokens(message)
-        if tokens.total_tokens > await self.TOKEN_LIMIT:
-            raise TokensLimitExceededError(
-                f"Input exceeds the token limit: {await self.TOKEN_LIMIT}, total tokens: {tokens.total_tokens}."
-            )
+        model_name = await self.GEMINI_MODEL_NAME
+        await self._check_token_limit(model_name, message)
         prompt = (
             "You are given a Discord message. Summarize the main points and key ideas "
             "in a concise manner in Czech. Focus on the most important information and provide "
             "a clear and coherent summary.\n\n"
             f"Message:\n{message}"
         )
-        return model.generate_content(prompt).text
+        return await gemini.generate(model_name, prompt, timeout=await self.REQ_TIMEOUT)
 
     async def _parse_message_id_to_message(
         self, channel: TextChannel, message_id: str
@@ -209,15 +391,6 @@ class TldrCog(ConfigCog):
             raise MessageIdInvalidError("Message not found based on the provided ID.")
         return message
 
-    async def _replace_user_mentions_with_their_names(self, message_content: str):
-        USER_RE = re.compile(r"<@\d+>")
-        searches = USER_RE.findall(message_content)
-        for search in searches:
-            user_id = search[2:-1]
-            user = await self.bot.fetch_user(user_id)
-            message_content = message_content.replace(search, user.name)
-        return message_content
-
     async def _tldr(
         self,
         channel: TextChannel,
@@ -239,35 +412,35 @@ class TldrCog(ConfigCog):
             raise StartMsgOlderThanEndMsgError()
 
         # Fetch the messages between the two messages and simplify them
-        messages = []
-
-        async for msg in channel.history(
-            after=message_after,
-            before=message_before,
-            oldest_first=True,
-            limit=await self.MESSAGES_LIMIT,
-        ):
-            if msg.author.bot:  # skip bot messages
-                continue
-
-            msg_content = msg.content
-
-            msg_content = await self._replace_user_mentions_with_their_names(
-                msg_content
+        history = [
+            msg
+            for msg in await channel_history(
+                self.bot,
+                channel,
+                after=message_after.id,
+                before=message_before.id,
+                limit=await self.MESSAGES_LIMIT,
             )
+            if not msg.author_bot  # skip bot messages
+        ]
+        # resolve the mentions of the whole range at once
+        contents = await self.mentions.replace_mentions(
+            [msg.content for msg in history], channel.guild
+        )
 
+        messages = []
+        for msg, msg_content in zip(history, contents):
             simplified_message = {
                 "id": msg.id,
-                "author": msg.author.name,
-                "created_at": msg.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                "author": msg.author_name,
+                "created_at": msg.created_at,
                 "message": msg_content,
             }
-            if msg.type == MessageType.reply:
-                simplified_message["reply_to"] = msg.reference.message_id
+            if msg.reference_id is not None:
+                simplified_message["reply_to"] = msg.reference_id
             messages.append(simplified_message)
 
-        serialized = json.dumps(messages)
-        tldr = await self._generate_tldr_from_conversation(serialized)
+        tldr = await self._generate_tldr_from_conversation(channel.id, messages)
         return tldr
 
 
@@ -1,16 +1,15 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import google.generativeai as genai
 
 from bot import BackroomsBot
-from consts import GEMINI_TOKEN
+from .utils.archive import channel_history
+from .utils.gemini import gemini
 
 
 class TranslationCog(commands.Cog):
     def __init__(self, bot: BackroomsBot) -> None:
         self.bot = bot
-        genai.configure(api_key=GEMINI_TOKEN)
 
     @app_commands.command(
         name="translate", description="Translate the last n messages to English"
@@ -27,12 +26,14 @@ class TranslationCog(commands.Cog):
             return
 
         # Fetch the last n messages from the channel
-        messages = []
-        async for message in interaction.channel.history(limit=n):
+        messages = [
+            message
+            for message in await channel_history(
+                self.bot, interaction.channel, limit=n, oldest_first=False
+            )
             # Skip bot messages and empty messages
-            if message.author.bot or not message.content:
-                continue
-            messages.append(message)
+            if not message.author_bot and message.content
+        ]
 
         if not messages:
             await interaction.followup.send(
@@ -46,7 +47,7 @@ class TranslationCog(commands.Cog):
         # Format messages for translation
         message_texts = []
         for msg in messages:
-            author_name = msg.author.display_name
+            author_name = msg.author_display_name
             content = msg.content
             message_texts.append(f"{author_name}: {content}")
 
@@ -54,21 +55,23 @@ class TranslationCog(commands.Cog):
 
         # Translate using Gemini
         try:
-            model = genai.GenerativeModel("gemini-3-flash-preview")
             prompt = (
                 "Translate the following Discord conversation to English. "
                 "Preserve the author names and maintain the conversation format. "
                 "Only translate the message content, not the author names.\n\n"
                 f"Conversation:\n{conversation}"
             )
-            response = model.generate_content(prompt)
-            result = response.text
+            result = await gemini.generate("gemini-3-flash-preview", prompt)
 
             # Discord message limit is 2000 characters
             if len(result) > 2000:
                 result = result[:1997] + "..."
 
             await interaction.followup.send(result, ephemeral=True)
+        except TimeoutError:
+            await interaction.followup.send(
+                "Translation timed out, try again later.", ephemeral=True
+            )
         except Exception as e:
             await interaction.followup.send(
                 f"Error translating messages: {str(e)}", ephemeral=True
@@ -0,0 +1,287 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+
+import discord
+from discord.ext import commands
+import motor.motor_asyncio as maio
+from pymongo import UpdateOne
+
+# archived spans are trusted for this long after they were last verified, edits and
+# deletes made while the bot wasn't following the channel show up once they are
+# fetched again
+SPAN_TTL = 24 * 60 * 60
+
+
+@dataclass(frozen=True)
+class ArchivedMessage:
+    """The parts of a message the bot needs to summarize or translate a conversation"""
+
+    id: int
+    channel_id: int
+    author_id: int
+    author_name: str
+    author_display_name: str
+    author_bot: bool
+    content: str
+    created_at: datetime
+    # the message this one replies to
+    reference_id: int | None = None
+
+    @classmethod
+    def from_message(cls, message: discord.Message) -> "ArchivedMessage":
+        reference_id = None
+        if message.type == discord.MessageType.reply and message.reference:
+            reference_id = message.reference.message_id
+        return cls(
+            id=message.id,
+            channel_id=message.channel.id,
+            author_id=message.author.id,
+            author_name=message.author.name,
+            author_display_name=message.author.display_name,
+            author_bot=message.author.bot,
+            content=message.content,
+            created_at=message.created_at,
+            reference_id=reference_id,
+        )
+
+    @classmethod
+    def from_document(cls, doc: dict) -> "ArchivedMessage":
+        fields = {k: v for k, v in doc.items() if k not in ("_id", "deleted")}
+        # mongo returns naive datetimes in UTC
+        created_at = fields["created_at"].replace(tzinfo=timezone.utc)
+        return cls(id=doc["_id"], **{**fields, "created_at": created_at})
+
+    def to_document(self) -> dict:
+        doc = asdict(self)
+        doc["_id"] = doc.pop("id")
+        return doc
+
+
+def now_snowflake() -> int:
+    """A snowflake newer than any existing message"""
+    return discord.utils.time_snowflake(discord.utils.utcnow(), high=True)
+
+
+async def fetch_history(
+    channel: discord.abc.Messageable,
+    after: int | None = None,
+    before: int | None = None,
+    limit: int | None = 100,
+    oldest_first: bool = True,
+) -> list[ArchivedMessage]:
+    """Fetch messages between the two snowflakes (exclusive) over REST"""
+    return [
+        ArchivedMessage.from_message(msg)
+        async for msg in channel.history(
+            after=after and discord.Object(id=after),
+            before=before and discord.Object(id=before),
+            limit=limit,
+            oldest_first=oldest_first,
+        )
+    ]
+
+
+class MessageArchive:
+    def __init__(
+        self,
+        messages: maio.AsyncIOMotorCollection,
+        spans: maio.AsyncIOMotorCollection,
+    ) -> None:
+        """
+        A local archive of channel messages, keyed by the message snowflake.
+
+        Deleted messages are only flagged, so the archive knows they are gone. `spans`
+        are the ranges of snowflakes `[start, end]` of a channel known to be archived
+        completely, either recorded live or fetched over REST. Anything else is a gap,
+        which is fetched over REST and archived when queried. Spans expire `SPAN_TTL`
+        seconds after they were last verified, live spans are verified as they go.
+        """
+        self.messages = messages
+        self.spans = spans
+        # channel id -> the span being extended by live messages, it covers
+        # everything up to now while the bot stays connected
+        self.live: dict[int, dict] = {}
+
+    async def ensure_indexes(self):
+        await self.messages.create_index([("channel_id", 1), ("_id", 1)])
+        await self.spans.create_index([("channel_id", 1), ("end", 1)])
+        await self.spans.create_index("verified_at", expireAfterSeconds=SPAN_TTL)
+
+    async def record(self, message: ArchivedMessage):
+        await self.messages.update_one(
+            {"_id": message.id},
+            {"$set": {**message.to_document(), "deleted": False}},
+            upsert=True,
+        )
+        span = self.live.get(message.channel_id)
+        if span is None:
+            span = {"channel_id": message.channel_id, "start": message.id}
+            span["end"] = message.id
+            doc = {**span, "verified_at": datetime.now(timezone.utc)}
+            span["_id"] = (await self.spans.insert_one(doc)).inserted_id
+            self.live[message.channel_id] = span
+        span["end"] = max(span["end"], message.id)
+
+    async def record_many(self, messages: list[ArchivedMessage]):
+        if messages:
+            await self.messages.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": msg.id},
+                        {"$set": {**msg.to_document(), "deleted": False}},
+                        upsert=True,
+                    )
+                    for msg in messages
+                ],
+                ordered=False,
+            )
+
+    async def edit(self, message_id: int, content: str):
+        await self.messages.update_one(
+            {"_id": message_id}, {"$set": {"content": content}}
+        )
+
+    async def delete(self, message_ids: list[int]):
+        await self.messages.update_many(
+            {"_id": {"$in": message_ids}}, {"$set": {"deleted": True}}
+        )
+
+    async def flush(self):
+        """Persist how far the live spans reach"""
+        now = datetime.now(timezone.utc)
+        for span in self.live.values():
+            await self.spans.update_one(
+                {"_id": span["_id"]},
+                {"$max": {"end": span["end"]}, "$set": {"verified_at": now}},
+            )
+
+    async def close_live(self):
+        """Stop extending the live spans, events may get lost from now on"""
+        await self.flush()
+        self.live.clear()
+
+    async def forget(self):
+        """Drop all spans, everything is fetched over REST again"""
+        self.live.clear()
+        await self.spans.delete_many({})
+
+    async def _segments(
+        self, channel_id: int, after: int, before: int
+    ) -> list[tuple[int, int, bool]]:
+        """
+        Split the snowflakes between `after` and `before` (exclusive) into
+        `(after, before, archived)` segments, ordered oldest first
+        """
+        expired = datetime.now(timezone.utc) - timedelta(seconds=SPAN_TTL)
+        spans = [
+            (span["start"], span["end"])
+            async for span in self.spans.find(
+                {
+                    "channel_id": channel_id,
+                    "start": {"$lt": before},
+                    "end": {"$gt": after},
+                    "verified_at": {"$gt": expired},
+                }
+            )
+        ]
+        live = self.live.get(channel_id)
+        if live is not None and live["start"] < before:
+            # the live span reaches up to now, but only `before` was asked for
+            spans.append((max(live["start"], after), before))
+
+        segments = []
+        # the newest snowflake covered so far
+        cursor = after
+        for start, end in sorted(spans):
+            if end <= cursor:
+                continue
+            if start > cursor + 1:
+                segments.append((cursor, min(start, before), False))
+            segments.append((max(cursor, start - 1), min(end + 1, before), True))
+            cursor = end
+            if cursor >= before - 1:
+                break
+        if cursor < before - 1:
+            segments.append((cursor, before, False))
+        return segments
+
+    async def history(
+        self,
+        channel: discord.abc.GuildChannel,
+        after: int | None = None,
+        before: int | None = None,
+        limit: int = 100,
+        oldest_first: bool = True,
+    ) -> list[ArchivedMessage]:
+        """
+        Messages between the two snowflakes (exclusive), served from the archive
+        and falling back to REST for the gaps, which are archived for next time
+        """
+        after = after or 0
+        before = before or now_snowflake()
+        segments = await self._segments(channel.id, after, before)
+        if not oldest_first:
+            segments.reverse()
+
+        result: list[ArchivedMessage] = []
+        for lo, hi, archived in segments:
+            remaining = limit - len(result)
+            if remaining <= 0:
+                break
+            if archived:
+                cursor = self.messages.find(
+                    {
+                        "channel_id": channel.id,
+                        "_id": {"$gt": lo, "$lt": hi},
+                        "deleted": False,
+                    }
+                )
+                cursor.sort("_id", 1 if oldest_first else -1).limit(remaining)
+                result += [ArchivedMessage.from_document(doc) async for doc in cursor]
+                continue
+
+            fetched = await fetch_history(channel, lo, hi, remaining, oldest_first)
+            await self.record_many(fetched)
+            if len(fetched) < remaining:
+                span = (lo + 1, hi - 1)
+            elif oldest_first:
+                span = (lo + 1, fetched[-1].id)
+            else:
+                span = (fetched[-1].id, hi - 1)
+            # what's no longer on discord was deleted while nobody was looking
+            await self.messages.update_many(
+                {
+                    "channel_id": channel.id,
+                    "_id": {
+                        "$gte": span[0],
+                        "$lte": span[1],
+                        "$nin": [msg.id for msg in fetched],
+                    },
+                },
+                {"$set": {"deleted": True}},
+            )
+            await self.spans.insert_one(
+                {
+                    "channel_id": channel.id,
+                    "start": span[0],
+                    "end": span[1],
+                    "verified_at": datetime.now(timezone.utc),
+                }
+            )
+            result += fetched
+        return result
+
+
+async def channel_history(
+    bot: commands.Bot,
+    channel: discord.abc.GuildChannel,
+    after: int | None = None,
+    before: int | None = None,
+    limit: int = 100,
+    oldest_first: bool = True,
+) -> list[ArchivedMessage]:
+    """Channel history from the archive if it's loaded, over REST otherwise"""
+    archive = bot.get_cog("ArchiveCog")
+    if archive is None:
+        return await fetch_history(channel, after, before, limit, oldest_first)
+    return await archive.history(channel, after, before, limit, oldest_first)
@@ -0,0 +1,609 @@
+import csv
+import gzip
+import io
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO
+from zoneinfo import ZoneInfo
+
+import motor.motor_asyncio as maio
+from pymongo import DESCENDING, ReturnDocument, UpdateOne
+
+TIMEZONE = "Europe/Prague"
+prague_tz = ZoneInfo(TIMEZONE)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# how long a user's summary is kept, rolling period counts may include
+# beers that left the period up to this many seconds ago
+SUMMARY_TTL = 60
+PERIODS = {
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+    "month": timedelta(days=30),
+    "year": timedelta(days=365),
+}
+EXPORT_BATCH = 1000
+EXPORT_COLUMNS = ["id", "user_id", "username", "timestamp", "weekday", "hour"]
+
+
+def as_utc(ts: datetime) -> datetime:
+    """Mongo returns naive UTC datetimes"""
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+@dataclass
+class BeerSummary:
+    total: int
+    last: datetime | None
+    # period -> (cutoff, beers since the cutoff)
+    recent: dict[str, tuple[datetime, int]] = field(default_factory=dict)
+    expires_at: float = 0.0
+
+
+def bucket_starts(ts: datetime) -> tuple[datetime, datetime]:
+    """The starts of the hour and the Prague day containing `ts`, in UTC"""
+    ts = as_utc(ts)
+    # Prague is a whole number of hours off UTC, so its hours are the UTC hours
+    hour = ts.replace(minute=0, second=0, microsecond=0)
+    day = ts.astimezone(prague_tz).replace(hour=0, minute=0, second=0, microsecond=0)
+    return hour, day.astimezone(timezone.utc)
+
+
+def bucket_edges(cutoff: datetime) -> tuple[datetime, datetime]:
+    """
+    The first whole hour and the first whole Prague day since `cutoff`, the time
+    before the hour is counted from events, then hourly buckets until the day
+    and daily buckets from then on
+    """
+    cutoff = as_utc(cutoff)
+    hour, day = bucket_starts(cutoff)
+    if hour < cutoff:
+        hour += timedelta(hours=1)
+    if day < cutoff:
+        # add a calendar day, it is 23 or 25 hours long when the clocks change
+        day = (day.astimezone(prague_tz) + timedelta(days=1)).astimezone(timezone.utc)
+    return hour, day
+
+
+def encode_cursor(beer: dict) -> str:
+    """The position of a beer in the listing, Mongo keeps milliseconds"""
+    timestamp = as_utc(beer["timestamp"])
+    return f"{(timestamp - EPOCH) // timedelta(milliseconds=1)}:{beer['id']}"
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    millis, beer_id = cursor.split(":", 1)
+    return EPOCH + timedelta(milliseconds=int(millis)), beer_id
+
+
+class BeerStore:
+    def __init__(self, db: maio.AsyncIOMotorDatabase) -> None:
+        """
+        Beers are stored one document per beer in `beer_events`,
+        `beer_tracker` keeps a document per user with their username and total count
+        and `beer_buckets` counts the beers of each user per hour and per Prague day.
+        Summaries of recently active users are cached and kept up to date by the
+        writes going through this store.
+        """
+        self.events = db.beer_events
+        self.users = db.beer_tracker
+        self.buckets = db.beer_buckets
+        self._summaries: dict[int, BeerSummary] = {}
+        # the (user_id, Prague day) buckets written to while they are being rebuilt
+        self._rebuilding: set[tuple[int, datetime]] | None = None
+
+    async def ensure_indexes(self):
+        await self.events.create_index(
+            [("user_id", 1), ("timestamp", DESCENDING), ("id", DESCENDING)]
+        )
+        await self.events.create_index("id", unique=True)
+        await self.events.create_index("timestamp")
+        await self.users.create_index("user_id", unique=True)
+        await self.users.create_index([("total_beers", DESCENDING)])
+        await self._index_buckets(self.buckets)
+
+    @staticmethod
+    async def _index_buckets(buckets: maio.AsyncIOMotorCollection):
+        await buckets.create_index(
+            [("user_id", 1), ("unit", 1), ("start", 1)], unique=True
+        )
+        await buckets.create_index([("unit", 1), ("start", 1)])
+
+    async def migrate(self):
+        """
+        Move beers from the embedded `beers` arrays of the user documents into events,
+        safe to run repeatedly and to resume after an interruption,
+        the buckets are rebuilt if anything was moved or they don't exist yet
+        """
+        migrated = False
+        async for user in self.users.find({"beers": {"$exists": True}}):
+            migrated = True
+            if user["beers"]:
+                await self.events.bulk_write(
+                    [
+                        UpdateOne(
+                            {"id": beer["id"]},
+                            {
+                                "$setOnInsert": {
+                                    "id": beer["id"],
+                                    "user_id": user["user_id"],
+                                    "timestamp": beer["timestamp"],
+                                }
+                            },
+                            upsert=True,
+                        )
+                        for beer in user["beers"]
+                    ],
+                    ordered=False,
+                )
+            total = await self.events.count_documents({"user_id": user["user_id"]})
+            await self.users.update_one(
+                {"_id": user["_id"]},
+                {"$set": {"total_beers": total}, "$unset": {"beers": ""}},
+            )
+        if migrated or not await self.buckets.find_one({}, {"_id": 1}):
+            await self.rebuild_buckets()
+
+    async def rebuild_buckets(self):
+        """
+        Regenerate the hourly and daily buckets from the events.
+
+        The buckets are built in a separate collection and swapped in, so stats keep
+        reading the old ones meanwhile. The days of the beers logged or deleted during
+        the rebuild may be missing from the new buckets, they are recounted from the
+        events after the swap.
+        """
+        self._rebuilding = set()
+        try:
+            await self._build_buckets()
+            # writes may land during the recount too, until there are none left
+            while touched := self._rebuilding:
+                self._rebuilding = set()
+                await self._recount(touched)
+        finally:
+            self._rebuilding = None
+        self._summaries.clear()
+
+    async def _build_buckets(self):
+        staging = self.buckets.database[f"{self.buckets.name}_rebuild"]
+        await staging.drop()
+        await self._index_buckets(staging)
+        parts = {"year": "$$p.year", "month": "$$p.month", "day": "$$p.day"}
+        starts = {
+            # UTC hours, see `bucket_starts`
+            "hour": {
+                "$let": {
+                    "vars": {"p": {"$dateToParts": {"date": "$timestamp"}}},
+                    "in": {"$dateFromParts": {**parts, "hour": "$$p.hour"}},
+                }
+            },
+            "day": {
+                "$let": {
+                    "vars": {
+                        "p": {
+                            "$dateToParts": {"date": "$timestamp", "timezone": TIMEZONE}
+                        }
+                    },
+                    "in": {"$dateFromParts": {**parts, "timezone": TIMEZONE}},
+                }
+            },
+        }
+        for unit, start in starts.items():
+            pipeline = [
+                {
+                    "$group": {
+                        "_id": {"user_id": "$user_id", "start": start},
+                        "count": {"$sum": 1},
+                    }
+                },
+                {
+                    "$project": {
+                        "_id": 0,
+                        "user_id": "$_id.user_id",
+                        "unit": {"$literal": unit},
+                        "start": "$_id.start",
+                        "count": 1,
+                    }
+                },
+                {
+                    "$merge": {
+                        "into": staging.name,
+                        "on": ["user_id", "unit", "start"],
+                        "whenMatched": "replace",
+                        "whenNotMatched": "insert",
+                    }
+                },
+            ]
+            await self.events.aggregate(pipeline).to_list(None)
+        await staging.rename(self.buckets.name, dropTarget=True)
+
+    async def _recount(self, days: set[tuple[int, datetime]]):
+        """Set the buckets of the given `(user_id, Prague day start)` to the events"""
+        ranges = []
+        for user_id, day in days:
+            # a calendar day, it is 23 or 25 hours long when the clocks change
+            end = (day.astimezone(prague_tz) + timedelta(days=1)).astimezone(
+                timezone.utc
+            )
+            ranges.append((user_id, day, end))
+        counts: Counter[tuple[int, str, datetime]] = Counter()
+        async for beer in self.events.find(
+            {
+                "$or": [
+                    {"user_id": user_id, "timestamp": {"$gte": day, "$lt": end}}
+                    for user_id, day, end in ranges
+                ]
+            },
+            {"_id": 0, "user_id": 1, "timestamp": 1},
+        ):
+            hour_start, day_start = bucket_starts(beer["timestamp"])
+            counts[beer["user_id"], "hour", hour_start] += 1
+            counts[beer["user_id"], "day", day_start] += 1
+        # buckets whose beers were all deleted meanwhile
+        async for bucket in self.buckets.find(
+            {
+                "$or": [
+                    {"user_id": user_id, "start": {"$gte": day, "$lt": end}}
+                    for user_id, day, end in ranges
+                ]
+            },
+            {"_id": 0, "user_id": 1, "unit": 1, "start": 1},
+        ):
+            key = (bucket["user_id"], bucket["unit"], as_utc(bucket["start"]))
+            counts.setdefault(key, 0)
+        if counts:
+            await self.buckets.bulk_write(
+                [
+                    UpdateOne(
+                        {"user_id": user_id, "unit": unit, "start": start},
+                        {"$set": {"count": count}},
+                        upsert=True,
+                    )
+                    for (user_id, unit, start), count in counts.items()
+                ],
+                ordered=False,
+            )
+
+    async def _bump(self, user_ids: list[int], timestamp: datetime, by: int):
+        hour, day = bucket_starts(timestamp)
+        if self._rebuilding is not None:
+            self._rebuilding.update((user_id, day) for user_id in user_ids)
+        await self.buckets.bulk_write(
+            [
+                UpdateOne(
+                    {"user_id": user_id, "unit": unit, "start": start},
+                    {"$inc": {"count": by}},
+                    upsert=True,
+                )
+                for user_id in user_ids
+                for unit, start in (("hour", hour), ("day", day))
+            ],
+            ordered=False,
+        )
+
+    def _since(self, cutoff: datetime, match: dict) -> list[dict]:
+        """
+        A pipeline over the buckets counting the beers since `cutoff` per user,
+        reading at most an hour of events and a day of hourly buckets
+        """
+        hour, day = bucket_edges(cutoff)
+        return [
+            {
+                "$match": {
+                    **match,
+                    "$or": [
+                        {"unit": "day", "start": {"$gte": day}},
+                        {"unit": "hour", "start": {"$gte": hour, "$lt": day}},
+                    ],
+                }
+            },
+            {
+                "$unionWith": {
+                    "coll": self.events.name,
+                    "pipeline": [
+                        {
+                            "$match": {
+                                **match,
+                                "timestamp": {"$gte": cutoff, "$lt": hour},
+                            }
+                        },
+                        {"$project": {"user_id": 1, "count": {"$literal": 1}}},
+                    ],
+                }
+            },
+            {"$group": {"_id": "$user_id", "count": {"$sum": "$count"}}},
+        ]
+
+    async def log(self, user_id: int, username: str) -> int:
+        """Log a beer, returns the new total of the user"""
+        timestamp = datetime.now(timezone.utc)
+        await self.events.insert_one(
+            {"id": str(uuid.uuid4()), "user_id": user_id, "timestamp": timestamp}
+        )
+        await self._bump([user_id], timestamp, 1)
+        user = await self.users.find_one_and_update(
+            {"user_id": user_id},
+            {
+                "$inc": {"total_beers": 1},
+                "$set": {"username": username},
+                "$max": {"last_beer": timestamp},
+            },
+            {"_id": 0, "total_beers": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._logged(user_id, user["total_beers"], timestamp, 1)
+        return user["total_beers"]
+
+    async def log_round(self, users: dict[int, str], count: int) -> dict[int, int]:
+        """
+        Log `count` beers for each of the users, given as user_id -> username,
+        with one bulk write per collection, returns the new totals
+        """
+        timestamp = datetime.now(timezone.utc)
+        await self.events.insert_many(
+            [
+                {"id": str(uuid.uuid4()), "user_id": user_id, "timestamp": timestamp}
+                for user_id in users
+                for _ in range(count)
+            ],
+            ordered=False,
+        )
+        await self._bump(list(users), timestamp, count)
+        await self.users.bulk_write(
+            [
+                UpdateOne(
+                    {"user_id": user_id},
+                    {
+                        "$inc": {"total_beers": count},
+                        "$set": {"username": username},
+                        "$max": {"last_beer": timestamp},
+                    },
+                    upsert=True,
+                )
+                for user_id, username in users.items()
+            ],
+            ordered=False,
+        )
+        totals = {
+            user["user_id"]: user["total_beers"]
+            async for user in self.users.find(
+                {"user_id": {"$in": list(users)}},
+                {"_id": 0, "user_id": 1, "total_beers": 1},
+            )
+        }
+        for user_id, total in totals.items():
+            self._logged(user_id, total, timestamp, count)
+        return totals
+
+    def _logged(self, user_id: int, total: int, timestamp: datetime, count: int):
+        if summary := self._summaries.get(user_id):
+            summary.total = total
+            summary.last = timestamp
+            for period, (cutoff, recent) in summary.recent.items():
+                summary.recent[period] = (cutoff, recent + count)
+
+    async def summary(self, user_id: int) -> BeerSummary:
+        """The user's total and last beer, read with projections on a miss"""
+        summary = self._summaries.get(user_id)
+        if summary is not None and summary.expires_at > time.monotonic():
+            return summary
+
+        user = await self.users.find_one(
+            {"user_id": user_id}, {"_id": 0, "total_beers": 1, "last_beer": 1}
+        )
+        total = user["total_beers"] if user else 0
+        last = user.get("last_beer") if user else None
+        if last is None and total:
+            last = await self._find_last(user_id)
+        summary = BeerSummary(
+            total,
+            last and as_utc(last),
+            expires_at=time.monotonic() + SUMMARY_TTL,
+        )
+        self._summaries[user_id] = summary
+        return summary
+
+    async def _find_last(self, user_id: int) -> datetime | None:
+        """Look the last beer up in the events and remember it on the user"""
+        beer = await self.events.find_one(
+            {"user_id": user_id},
+            {"_id": 0, "timestamp": 1},
+            sort=[("timestamp", DESCENDING)],
+        )
+        if beer is None:
+            await self.users.update_one(
+                {"user_id": user_id}, {"$unset": {"last_beer": ""}}
+            )
+            return None
+        await self.users.update_one(
+            {"user_id": user_id}, {"$set": {"last_beer": beer["timestamp"]}}
+        )
+        return beer["timestamp"]
+
+    async def total(self, user_id: int) -> int:
+        return (await self.summary(user_id)).total
+
+    async def last(self, user_id: int) -> datetime | None:
+        """When the user had their last beer, in UTC"""
+        return (await self.summary(user_id)).last
+
+    async def recent(self, user_id: int, period: str) -> int:
+        """Beers the user had in the last `period`, one of `PERIODS`"""
+        summary = await self.summary(user_id)
+        if period not in summary.recent:
+            cutoff = datetime.now(timezone.utc) - PERIODS[period]
+            count = await self.count_since(user_id, cutoff) if summary.total else 0
+            summary.recent[period] = (cutoff, count)
+        return summary.recent[period][1]
+
+    async def count_since(self, user_id: int, cutoff: datetime) -> int:
+        pipeline = self._since(cutoff, {"user_id": user_id})
+        async for row in self.buckets.aggregate(pipeline):
+            return row["count"]
+        return 0
+
+    async def page(
+        self,
+        user_id: int,
+        limit: int,
+        cursor: tuple[datetime, str] | None = None,
+        newer: bool = False,
+    ) -> tuple[list[dict], bool]:
+        """
+        Up to `limit` of the user's beers newest first, older (or `newer`) than
+        the `(timestamp, id)` cursor, and whether there are more past them
+        """
+        query = {"user_id": user_id}
+        if cursor is not None:
+            timestamp, beer_id = cursor
+            op = "$gt" if newer else "$lt"
+            query["$or"] = [
+                {"timestamp": {op: timestamp}},
+                {"timestamp": timestamp, "id": {op: beer_id}},
+            ]
+        order = 1 if newer else DESCENDING
+        beers = (
+            await self.events.find(query, {"_id": 0, "id": 1, "timestamp": 1})
+            .sort([("timestamp", order), ("id", order)])
+            .limit(limit + 1)
+            .to_list(limit + 1)
+        )
+        more = len(beers) > limit
+        beers = beers[:limit]
+        if newer:
+            beers.reverse()
+        return beers, more
+
+    async def leaderboard(
+        self, cutoff: datetime | None, limit: int
+    ) -> list[tuple[int, int]]:
+        """
+        The top `limit` drinkers since `cutoff` as `(user_id, count)`, counted
+        by the database from the buckets, only the returned rows are transferred
+        """
+        if cutoff is None:
+            # all time, straight from the counters
+            pipeline = [
+                {"$match": {"total_beers": {"$gt": 0}}},
+                {"$sort": {"total_beers": -1}},
+                {"$limit": limit},
+                {"$project": {"_id": "$user_id", "count": "$total_beers"}},
+            ]
+            collection = self.users
+        else:
+            pipeline = [
+                *self._since(cutoff, {}),
+                # deleted beers can leave empty buckets behind
+                {"$match": {"count": {"$gt": 0}}},
+                {"$sort": {"count": -1, "_id": 1}},
+                {"$limit": limit},
+            ]
+            collection = self.buckets
+        return [
+            (row["_id"], row["count"]) async for row in collection.aggregate(pipeline)
+        ]
+
+    async def owner(self, beer_id: str) -> int | None:
+        beer = await self.events.find_one({"id": beer_id}, {"_id": 0, "user_id": 1})
+        return beer and beer["user_id"]
+
+    async def delete(self, beer_id: str, user_id: int) -> dict | None:
+        """
+        Delete a beer if it belongs to the user, returns the deleted beer or None
+        when the user has no beer with that id
+        """
+        beer = await self.events.find_one_and_delete(
+            {"id": beer_id, "user_id": user_id}, {"_id": 0}
+        )
+        if beer is None:
+            return None
+
+        user = await self.users.find_one_and_update(
+            {"user_id": user_id},
+            {"$inc": {"total_beers": -1}},
+            {"_id": 0, "total_beers": 1, "last_beer": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        await self._bump([user_id], beer["timestamp"], -1)
+        last = user and user.get("last_beer")
+        if last is not None and as_utc(last) <= as_utc(beer["timestamp"]):
+            last = await self._find_last(user_id)
+
+        if summary := self._summaries.get(user_id):
+            timestamp = as_utc(beer["timestamp"])
+            summary.total = user["total_beers"] if user else 0
+            summary.last = last and as_utc(last)
+            for period, (cutoff, count) in summary.recent.items():
+                if timestamp >= cutoff:
+                    summary.recent[period] = (cutoff, count - 1)
+        return beer
+
+    async def export(self, fp: BinaryIO, user_id: int | None = None) -> int:
+        """
+        Write the beers, oldest first, as gzipped CSV into `fp` while streaming them
+        from the database, weekday (1 is Monday) and hour are in Prague time,
+        returns the number of beers written
+        """
+        query = {} if user_id is None else {"user_id": user_id}
+        usernames = {
+            user["user_id"]: user.get("username", "")
+            async for user in self.users.find(
+                query, {"_id": 0, "user_id": 1, "username": 1}
+            )
+        }
+        rows = 0
+        with gzip.GzipFile(fileobj=fp, mode="wb") as archive:
+            with io.TextIOWrapper(archive, encoding="utf-8", newline="") as text:
+                writer = csv.writer(text)
+                writer.writerow(EXPORT_COLUMNS)
+                cursor = self.events.find(
+                    query,
+                    {"_id": 0, "id": 1, "user_id": 1, "timestamp": 1},
+                    batch_size=EXPORT_BATCH,
+                ).sort("timestamp", 1)
+                async for beer in cursor:
+                    timestamp = as_utc(beer["timestamp"])
+                    local = timestamp.astimezone(prague_tz)
+                    writer.writerow(
+                        [
+                            beer["id"],
+                            beer["user_id"],
+                            usernames.get(beer["user_id"], ""),
+                            timestamp.isoformat(),
+                            local.isoweekday(),
+                            local.hour,
+                        ]
+                    )
+                    rows += 1
+        return rows
+
+    async def histograms(
+        self, user_id: int | None = None
+    ) -> tuple[list[int], list[int]]:
+        """Beers per weekday (Monday first) and per hour of the day in Prague time"""
+        query = {} if user_id is None else {"user_id": user_id}
+        by = {
+            "weekdays": {"$isoDayOfWeek": {"date": "$timestamp", "timezone": TIMEZONE}},
+            "hours": {"$hour": {"date": "$timestamp", "timezone": TIMEZONE}},
+        }
+        pipeline = [
+            {"$match": query},
+            {
+                "$facet": {
+                    name: [{"$group": {"_id": key, "count": {"$sum": 1}}}]
+                    for name, key in by.items()
+                }
+            },
+        ]
+        weekdays, hours = [0] * 7, [0] * 24
+        async for result in self.events.aggregate(pipeline):
+            for row in result["weekdays"]:
+                weekdays[row["_id"] - 1] = row["count"]
+            for row in result["hours"]:
+                hours[row["_id"]] = row["count"]
+        return weekdays, hours
@@ -0,0 +1,51 @@
+import asyncio
+
+import google.generativeai as genai
+
+from consts import GEMINI_TOKEN
+
+genai.configure(api_key=GEMINI_TOKEN)
+
+
+class GeminiBackend:
+    def __init__(self, max_concurrency: int = 4, timeout: float = 60) -> None:
+        """
+        Async access to the Gemini SDK, shared by every cog that talks to Gemini.
+
+        Uses the SDK's async methods, so the gateway loop is never blocked,
+        allows at most `max_concurrency` calls in flight at once and cancels
+        calls that take longer than `timeout` seconds with `TimeoutError`.
+        """
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.timeout = timeout
+        self._models: dict[str, genai.GenerativeModel] = {}
+
+    def model(self, name: str) -> genai.GenerativeModel:
+        try:
+            return self._models[name]
+        except KeyError:
+            model = self._models[name] = genai.GenerativeModel(name)
+            return model
+
+    async def _call(self, method, content: str, timeout: float | None):
+        async with self.semaphore:
+            return await asyncio.wait_for(method(content), timeout or self.timeout)
+
+    async def count_tokens(
+        self, model_name: str, content: str, timeout: float | None = None
+    ) -> int:
+        """Count the tokens of `content` as seen by the given model"""
+        model = self.model(model_name)
+        response = await self._call(model.count_tokens_async, content, timeout)
+        return response.total_tokens
+
+    async def generate(
+        self, model_name: str, prompt: str, timeout: float | None = None
+    ) -> str:
+        """Generate a completion for `prompt` and return its text"""
+        model = self.model(model_name)
+        response = await self._call(model.generate_content_async, prompt, timeout)
+        return response.text
+
+
+gemini = GeminiBackend()
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import motor.motor_asyncio as maio
+
+
+def normalize(conversation: list[dict]) -> list[tuple[str, str]]:
+    """Ignore differences in whitespace and letter case between otherwise identical prompts"""
+    return [
+        (msg["role"], " ".join(msg["content"].split()).casefold())
+        for msg in conversation
+    ]
+
+
+def cache_key(model: str, conversation: list[dict]) -> str:
+    """The content address of a prompt, the model and the normalized conversation"""
+    payload = json.dumps([model, normalize(conversation)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl: float = 3600,
+        collection: maio.AsyncIOMotorCollection | None = None,
+    ) -> None:
+        """
+        A cache of LLM responses keyed by (model, normalized conversation).
+
+        Entries live in a bounded in-memory LRU, and optionally in a mongo collection,
+        both expire after `ttl` seconds.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.collection = collection
+        # key -> (expires at, response), least recently used first
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    async def ensure_indexes(self):
+        if self.collection is None:
+            return
+        await self.collection.create_index("key", unique=True)
+        # documents are removed by mongo once `expires_at` passes
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, model: str, conversation: list[dict]) -> str | None:
+        key = cache_key(model, conversation)
+        try:
+            expires_at, response = self._entries[key]
+        except KeyError:
+            pass
+        else:
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return response
+            del self._entries[key]
+
+        if self.collection is not None:
+            doc = await self.collection.find_one(
+                {"key": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+            )
+            if doc is not None:
+                self._remember(key, doc["response"])
+                self.db_hits += 1
+                return doc["response"]
+
+        self.misses += 1
+        return None
+
+    async def put(self, model: str, conversation: list[dict], response: str):
+        key = cache_key(model, conversation)
+        self._remember(key, response)
+        if self.collection is not None:
+            await self.collection.update_one(
+                {"key": key},
+                {
+                    "$set": {
+                        "model": model,
+                        "response": response,
+                        "expires_at": datetime.now(timezone.utc)
+                        + timedelta(seconds=self.ttl),
+                    }
+                },
+                upsert=True,
+            )
+
+    def _remember(self, key: str, response: str):
+        self._entries[key] = (time.monotonic() + self.ttl, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+        }
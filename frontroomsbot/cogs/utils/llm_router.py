@@ -0,0 +1,210 @@
+import asyncio
+import math
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable
+
+OnText = Callable[[str], Awaitable[None]] | None
+# make a request to the given model
+Call = Callable[[str, OnText], Awaitable[str]]
+
+
+def parse_routes(routes: str) -> dict[str, list[str]]:
+    """
+    Parse fallback routes, e.g. `gemini-pro>model-a>model-b;model-c>model-a`
+    into `{"gemini-pro": ["model-a", "model-b"], "model-c": ["model-a"]}`
+    """
+    parsed = {}
+    for route in routes.split(";"):
+        models = [model.strip() for model in route.split(">") if model.strip()]
+        if models:
+            parsed[models[0]] = models[1:]
+    return parsed
+
+
+class ProviderStats:
+    def __init__(
+        self, alpha: float = 0.2, half_life: float = 120, samples: int = 50
+    ) -> None:
+        """
+        Latency and error EWMAs of a single model.
+
+        The error rate also decays with time (`half_life` seconds), so a model that was
+        demoted for failing gets traffic again eventually.
+        """
+        self.alpha = alpha
+        self.half_life = half_life
+        self.latency: float | None = None
+        self._error = 0.0
+        self._error_at = time.monotonic()
+        self._latencies: deque[float] = deque(maxlen=samples)
+
+    def error_rate(self) -> float:
+        elapsed = time.monotonic() - self._error_at
+        return self._error * 0.5 ** (elapsed / self.half_life)
+
+    def _update_error(self, value: float):
+        self._error = (1 - self.alpha) * self.error_rate() + self.alpha * value
+        self._error_at = time.monotonic()
+
+    def record_success(self, latency: float):
+        self._update_error(0)
+        self._latencies.append(latency)
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = (1 - self.alpha) * self.latency + self.alpha * latency
+
+    def record_failure(self):
+        self._update_error(1)
+
+    def p95(self) -> float | None:
+        """The 95th percentile of recent latencies, None until there are enough samples"""
+        if len(self._latencies) < 10:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[math.ceil(0.95 * len(ordered)) - 1]
+
+
+class _Race:
+    def __init__(self, on_text: OnText) -> None:
+        """The attempts of a single routed request, the first to answer wins"""
+        self.on_text = on_text
+        self.winner: str | None = None
+        self.claimed = asyncio.Event()
+
+    def claim(self, model: str) -> bool:
+        if self.winner is None:
+            self.winner = model
+            self.claimed.set()
+        return self.winner == model
+
+
+class Router:
+    def __init__(
+        self,
+        retry_on: tuple[type[BaseException], ...],
+        error_threshold: float = 0.5,
+        default_hedge_delay: float = 5,
+    ) -> None:
+        """
+        Routes a request over an ordered list of models, falling back to the next one
+        when a model fails with one of the `retry_on` errors.
+
+        Models with an error rate over `error_threshold` are tried last. With hedging,
+        a second model is asked once the first one takes longer than its p95 latency
+        (or `default_hedge_delay` before there are enough samples), and whichever
+        answers first wins. Once a model has streamed text to the user, it can't be
+        replaced anymore.
+        """
+        self.retry_on = retry_on
+        self.error_threshold = error_threshold
+        self.default_hedge_delay = default_hedge_delay
+        self.stats: defaultdict[str, ProviderStats] = defaultdict(ProviderStats)
+
+    def order(self, models: list[str]) -> list[str]:
+        """
+        The requested model goes first unless it's failing,
+        the fallbacks are ordered by how fast and reliable they are
+        """
+        primary, fallbacks = models[0], models[1:]
+
+        def score(model: str) -> float:
+            stats = self.stats[model]
+            return (stats.latency or 0) * (1 + stats.error_rate())
+
+        ordered = [primary, *sorted(fallbacks, key=score)]
+        return sorted(
+            ordered, key=lambda m: self.stats[m].error_rate() > self.error_threshold
+        )
+
+    def hedge_delay(self, model: str) -> float:
+        return self.stats[model].p95() or self.default_hedge_delay
+
+    async def _attempt(self, model: str, call: Call, race: _Race) -> str:
+        start = time.monotonic()
+        answered = False
+
+        async def on_text(delta: str):
+            nonlocal answered
+            if not answered:
+                answered = True
+                self.stats[model].record_success(time.monotonic() - start)
+            # text from a model that lost the race is dropped, it is about to be cancelled
+            if race.claim(model):
+                await race.on_text(delta)
+
+        try:
+            result = await call(model, on_text if race.on_text else None)
+        except self.retry_on:
+            self.stats[model].record_failure()
+            raise
+        if not answered:
+            self.stats[model].record_success(time.monotonic() - start)
+        race.claim(model)
+        return result
+
+    async def run(
+        self,
+        models: list[str],
+        call: Call,
+        on_text: OnText = None,
+        hedge: bool = False,
+    ) -> tuple[str, str]:
+        """
+        Make the request, returns the model that answered and its answer.
+
+        Raises the last error if every model failed.
+        """
+        race = _Race(on_text)
+        queue = self.order(models)
+        attempts: dict[asyncio.Task, str] = {}
+        last_error: BaseException | None = None
+
+        def launch():
+            model = queue.pop(0)
+            attempts[asyncio.create_task(self._attempt(model, call, race))] = model
+
+        launch()
+        try:
+            while attempts:
+                timeout = None
+                if hedge and queue and len(attempts) == 1:
+                    timeout = self.hedge_delay(next(iter(attempts.values())))
+
+                claimed = asyncio.create_task(race.claimed.wait())
+                done, _ = await asyncio.wait(
+                    [*attempts, claimed],
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                claimed.cancel()
+
+                if race.winner is not None:
+                    winner = next(t for t, m in attempts.items() if m == race.winner)
+                    for task in attempts:
+                        if task is not winner:
+                            task.cancel()
+                    return race.winner, await winner
+
+                if not done:
+                    # the request is taking too long, hedge it
+                    launch()
+                    continue
+
+                for task in done:
+                    if task is claimed:
+                        continue
+                    del attempts[task]
+                    try:
+                        task.result()
+                    except self.retry_on as e:
+                        last_error = e
+                if not attempts and queue:
+                    launch()
+            assert last_error is not None
+            raise last_error
+        finally:
+            for task in attempts:
+                task.cancel()
+            await asyncio.gather(*attempts, return_exceptions=True)
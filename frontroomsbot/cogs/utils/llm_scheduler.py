@@ -0,0 +1,128 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+
+
+class QueueFullError(Exception):
+    """The request was rejected, because too many requests are already waiting"""
+
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: int = 1) -> None:
+        """Allows `rate_per_minute` requests on average, with bursts of up to `burst` requests"""
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        self._refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+
+class ProviderScheduler:
+    def __init__(
+        self,
+        max_in_flight: int = 4,
+        requests_per_minute: float = 30,
+        burst: int = 5,
+        max_queued: int = 20,
+    ) -> None:
+        """
+        Limits the requests to a single LLM provider.
+
+        At most `max_in_flight` requests run at once, waiting requests are queued FIFO per user
+        and the users take turns, so a single user can't starve the others. Requests are further
+        rate limited by a token bucket matching the provider's quota. Once `max_queued` requests
+        wait, new ones are rejected with `QueueFullError`.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.bucket = TokenBucket(requests_per_minute, burst)
+        self.in_flight = 0
+        self.queued = 0
+        # user id -> their waiting requests, in the order the users take turns
+        self._queues: OrderedDict[int, deque[asyncio.Future]] = OrderedDict()
+
+    def position(self, user_id: int, future: asyncio.Future) -> int:
+        """The 1-based position in which the waiting request will be started"""
+        users = list(self._queues.items())
+        index = next(i for i, (user, _) in enumerate(users) if user == user_id)
+        round_ = users[index][1].index(future)
+        ahead = sum(min(len(queue), round_) for _, queue in users)
+        ahead += sum(1 for _, queue in users[:index] if len(queue) > round_)
+        return ahead + 1
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_id: int,
+        on_queued: Callable[[int], Awaitable[None]] | None = None,
+    ):
+        """
+        Wait for a slot to make a request in, `on_queued` is called with the queue
+        position if the request has to wait.
+        """
+        await self._acquire(user_id, on_queued)
+        try:
+            await self.bucket.acquire()
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, user_id: int, on_queued):
+        if self.in_flight < self.max_in_flight and not self.queued:
+            self.in_flight += 1
+            return
+        if self.queued >= self.max_queued:
+            raise QueueFullError()
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(future)
+        self.queued += 1
+        try:
+            if on_queued is not None:
+                await on_queued(self.position(user_id, future))
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # the slot was already handed over to us
+                self._release()
+            else:
+                self._remove(user_id, future)
+            raise
+
+    def _remove(self, user_id: int, future: asyncio.Future):
+        queue = self._queues.get(user_id)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self.queued -= 1
+            if not queue:
+                del self._queues[user_id]
+
+    def _release(self):
+        self.in_flight -= 1
+        while self.in_flight < self.max_in_flight and self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            self.queued -= 1
+            if queue:
+                # the user goes to the back of the line
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
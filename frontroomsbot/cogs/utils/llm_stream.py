@@ -0,0 +1,99 @@
+import json
+import time
+from typing import AsyncIterator
+
+import discord
+import httpx
+
+MESSAGE_LIMIT = 2000
+PLACEHOLDER = "*…*"
+
+
+async def iter_sse(response: httpx.Response) -> AsyncIterator[dict]:
+    """
+    Iterate over the JSON payloads of a server-sent events response
+
+    Both Groq (OpenAI-compatible) and Gemini (`alt=sse`) send one JSON object per `data:` line,
+    Groq terminates the stream with `data: [DONE]`.
+    """
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        payload = line[len("data:") :].strip()
+        if not payload or payload == "[DONE]":
+            continue
+        yield json.loads(payload)
+
+
+class StreamingReply:
+    def __init__(
+        self,
+        message: discord.Message,
+        edit_interval: float = 1.5,
+        allowed_mentions: discord.AllowedMentions | None = None,
+    ):
+        """
+        A reply to `message` that is progressively edited as text streams in.
+
+        Edits are made at most once per `edit_interval` seconds to stay within the message edit
+        rate limits, text over the 2000 character limit rolls over into a new reply.
+        """
+        self.message = message
+        self.edit_interval = edit_interval
+        self.allowed_mentions = allowed_mentions
+        self.text = ""
+        self.replies: list[discord.Message] = []
+        # what each of the replies currently shows
+        self._shown: list[str] = []
+        self._last_flush = 0.0
+
+    async def start(self, placeholder: str = PLACEHOLDER):
+        """Post the placeholder reply"""
+        await self._send(placeholder)
+        self._last_flush = time.monotonic()
+
+    async def set_placeholder(self, placeholder: str = PLACEHOLDER):
+        """Replace the placeholder, as long as no text streamed in yet"""
+        if self.text or not self.replies:
+            return
+        await self.replies[0].edit(content=placeholder)
+        self._shown[0] = placeholder
+
+    async def push(self, delta: str):
+        """Append streamed text, flushing it to discord if enough time has passed"""
+        self.text += delta
+        if time.monotonic() - self._last_flush >= self.edit_interval:
+            await self._flush()
+
+    async def finish(self):
+        """Flush the remaining text"""
+        await self._flush()
+
+    async def fail(self, error: str):
+        """Show an error, in place of the placeholder if nothing was streamed yet"""
+        if not self.text and self.replies:
+            await self.replies[0].edit(content=error)
+            self._shown[0] = error
+        else:
+            await self._flush()
+            await self._send(error)
+
+    async def _send(self, content: str):
+        reply = await self.message.reply(
+            content, allowed_mentions=self.allowed_mentions
+        )
+        self.replies.append(reply)
+        self._shown.append(content)
+
+    async def _flush(self):
+        self._last_flush = time.monotonic()
+        chunks = [
+            self.text[i : i + MESSAGE_LIMIT]
+            for i in range(0, len(self.text), MESSAGE_LIMIT)
+        ]
+        for i, chunk in enumerate(chunks):
+            if i >= len(self.replies):
+                await self._send(chunk)
+            elif self._shown[i] != chunk:
+                await self.replies[i].edit(content=chunk)
+                self._shown[i] = chunk
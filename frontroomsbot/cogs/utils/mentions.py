@@ -0,0 +1,100 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from typing import Iterable
+
+import discord
+
+# <@id> and <@!id> users, <@&id> roles, <#id> channels
+MENTION_RE = re.compile(r"<(@!?|@&|#)(\d+)>")
+
+
+class MentionResolver:
+    def __init__(
+        self,
+        bot: discord.Client,
+        ttl: float = 3600,
+        max_concurrency: int = 5,
+        max_entries: int = 4096,
+    ) -> None:
+        """
+        Replaces mentions in message contents with the names they refer to.
+
+        User names are looked up in the guild member cache first, the remaining users are
+        fetched concurrently (at most `max_concurrency` at once). Names are cached for
+        `ttl` seconds across invocations, evicting the least recently used ones beyond
+        `max_entries`.
+        """
+        self.bot = bot
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # user id -> (expires at, name), None for users that don't exist
+        self._users: OrderedDict[int, tuple[float, str | None]] = OrderedDict()
+
+    def _remember(self, user_id: int, name: str | None):
+        self._users[user_id] = (time.monotonic() + self.ttl, name)
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_entries:
+            self._users.popitem(last=False)
+
+    def _cached_user(self, user_id: int, guild: discord.Guild | None) -> bool:
+        # the member cache is kept up to date by the gateway, renames included
+        user = (guild and guild.get_member(user_id)) or self.bot.get_user(user_id)
+        if user is not None:
+            self._remember(user_id, user.name)
+            return True
+        entry = self._users.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._users.move_to_end(user_id)
+            return True
+        self._users.pop(user_id, None)
+        return False
+
+    async def _fetch_user(self, user_id: int):
+        async with self.semaphore:
+            try:
+                name = (await self.bot.fetch_user(user_id)).name
+            except discord.NotFound:
+                name = None
+        self._remember(user_id, name)
+
+    async def resolve(self, contents: Iterable[str], guild: discord.Guild | None):
+        """Make sure every user mentioned in `contents` is cached"""
+        user_ids = {
+            int(user_id)
+            for content in contents
+            for kind, user_id in MENTION_RE.findall(content)
+            if kind in ("@", "@!")
+        }
+        missing = [uid for uid in user_ids if not self._cached_user(uid, guild)]
+        await asyncio.gather(*map(self._fetch_user, missing))
+
+    def _name(self, kind: str, id: int, guild: discord.Guild | None) -> str | None:
+        if kind == "@&":
+            role = guild and guild.get_role(id)
+            return role and f"@{role.name}"
+        if kind == "#":
+            channel = (
+                guild and guild.get_channel_or_thread(id)
+            ) or self.bot.get_channel(id)
+            return channel and f"#{channel.name}"
+        entry = self._users.get(id)
+        return entry and entry[1]
+
+    def substitute(self, content: str, guild: discord.Guild | None) -> str:
+        """Replace the already resolved mentions, unknown ones are left as they are"""
+
+        def replace(match: re.Match) -> str:
+            name = self._name(match.group(1), int(match.group(2)), guild)
+            return name or match.group(0)
+
+        return MENTION_RE.sub(replace, content)
+
+    async def replace_mentions(
+        self, contents: list[str], guild: discord.Guild | None
+    ) -> list[str]:
+        """Replace the mentions in a whole batch of message contents"""
+        await self.resolve(contents, guild)
+        return [self.substitute(content, guild) for content in contents]
@@ -0,0 +1,45 @@
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+
+
+@dataclass(frozen=True)
+class CachedMessage:
+    id: int
+    content: str
+    # authored by the bot itself, i.e. an LLM answer
+    from_bot: bool
+    # the message this one replies to
+    reference_id: int | None
+
+
+class MessageCache:
+    def __init__(self, max_entries: int = 2048) -> None:
+        """
+        A bounded in-process cache of messages, evicting the least recently used ones.
+
+        Used to walk reply chains without fetching every message over REST.
+        """
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, CachedMessage] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, message_id: int) -> CachedMessage | None:
+        entry = self._entries.get(message_id)
+        if entry is not None:
+            self._entries.move_to_end(message_id)
+        return entry
+
+    def add(self, entry: CachedMessage):
+        self._entries[entry.id] = entry
+        self._entries.move_to_end(entry.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def update_content(self, message_id: int, content: str):
+        if (entry := self._entries.get(message_id)) is not None:
+            self._entries[message_id] = replace(entry, content=content)
+
+    def discard(self, message_id: int):
+        self._entries.pop(message_id, None)
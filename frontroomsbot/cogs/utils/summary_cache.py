@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+
+import motor.motor_asyncio as maio
+from pymongo import UpdateOne
+
+# cached summaries of windows nobody asked about for a while are dropped
+WINDOW_TTL = 30 * 24 * 60 * 60
+
+
+class WindowSummaryCache:
+    def __init__(self, collection: maio.AsyncIOMotorCollection) -> None:
+        """
+        Summaries of conversation windows, keyed by the channel, the snowflakes
+        of the first and the last message of the window and the model.
+
+        A window summary is dropped once a message inside of it is edited or deleted.
+        """
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_index(
+            [("channel_id", 1), ("first_id", 1), ("last_id", 1), ("model", 1)],
+            unique=True,
+        )
+        await self.collection.create_index("used_at", expireAfterSeconds=WINDOW_TTL)
+
+    async def get_many(
+        self, channel_id: int, model: str, windows: list[tuple[int, int]]
+    ) -> dict[tuple[int, int], str]:
+        """Cached summaries of the given `(first_id, last_id)` windows"""
+        if not windows:
+            return {}
+        query = {
+            "channel_id": channel_id,
+            "model": model,
+            "$or": [{"first_id": first, "last_id": last} for first, last in windows],
+        }
+        docs = [doc async for doc in self.collection.find(query)]
+        if docs:
+            # keep the windows in use from expiring
+            await self.collection.update_many(
+                {"_id": {"$in": [doc["_id"] for doc in docs]}},
+                {"$set": {"used_at": datetime.now(timezone.utc)}},
+            )
+        return {(doc["first_id"], doc["last_id"]): doc["summary"] for doc in docs}
+
+    async def put_many(
+        self, channel_id: int, model: str, summaries: dict[tuple[int, int], str]
+    ):
+        if not summaries:
+            return
+        now = datetime.now(timezone.utc)
+        await self.collection.bulk_write(
+            [
+                UpdateOne(
+                    {
+                        "channel_id": channel_id,
+                        "first_id": first,
+                        "last_id": last,
+                        "model": model,
+                    },
+                    {"$set": {"summary": summary, "used_at": now}},
+                    upsert=True,
+                )
+                for (first, last), summary in summaries.items()
+            ],
+            ordered=False,
+        )
+
+    async def invalidate(self, channel_id: int, message_ids: list[int]):
+        """Drop the windows containing any of the messages"""
+        await self.collection.delete_many(
+            {
+                "channel_id": channel_id,
+                "$or": [
+                    {"first_id": {"$lte": message_id}, "last_id": {"$gte": message_id}}
+                    for message_id in message_ids
+                ],
+            }
+        )
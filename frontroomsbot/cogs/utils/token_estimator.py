@@ -0,0 +1,129 @@
+import math
+import re
+from typing import Iterable
+
+# runs of ASCII letters, mostly english (and czech without diacritics) words
+ASCII_WORD_RE = re.compile(r"[A-Za-z]+")
+# letters outside of ASCII, czech diacritics, cyrillic, ...
+NON_ASCII_RE = re.compile(r"[^\x00-\x7f\s]")
+DIGIT_RE = re.compile(r"\d")
+# punctuation and symbols, JSON quotes and braces among them
+SYMBOL_RE = re.compile(r"[^\w\s]")
+
+FEATURES = ("ascii_words", "ascii_letters", "non_ascii", "digits", "symbols")
+
+# uncalibrated starting weights, good enough to size summary windows, run
+# benchmarks/token_estimator.py to calibrate them against real Gemini counts
+DEFAULT_WEIGHTS = (0.62, 0.11, 0.52, 0.98, 0.71)
+
+
+def features(text: str) -> tuple[int, ...]:
+    ascii_words = ASCII_WORD_RE.findall(text)
+    return (
+        len(ascii_words),
+        sum(map(len, ascii_words)),
+        len(NON_ASCII_RE.findall(text)),
+        len(DIGIT_RE.findall(text)),
+        len(SYMBOL_RE.findall(text)),
+    )
+
+
+def _solve(matrix: list[list[float]], vector: list[float]) -> list[float]:
+    """Solve a small linear system by Gaussian elimination with partial pivoting"""
+    n = len(vector)
+    rows = [row[:] + [value] for row, value in zip(matrix, vector)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(rows[r][col]))
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        if abs(rows[col][col]) < 1e-12:
+            # the feature never occurs in the sample, leave its weight at zero
+            continue
+        for r in range(n):
+            if r != col:
+                factor = rows[r][col] / rows[col][col]
+                rows[r] = [a - factor * b for a, b in zip(rows[r], rows[col])]
+    return [
+        row[n] / row[i] if abs(row[i]) >= 1e-12 else 0.0 for i, row in enumerate(rows)
+    ]
+
+
+class TokenEstimator:
+    def __init__(
+        self,
+        weights: tuple[float, ...] = DEFAULT_WEIGHTS,
+        error: float | None = None,
+    ) -> None:
+        """
+        Estimates the number of Gemini tokens of a text without a network round-trip.
+
+        The estimate is a linear combination of cheap text features (words, letters,
+        digits, symbols), with weights fitted against real token counts. `error`
+        is the measured relative error, used to tell when an estimate is too close
+        to a limit to be trusted. Without it the estimator is uncalibrated and never
+        decides a limit on its own.
+        """
+        self.weights = weights
+        self.error = error
+
+    def estimate(self, text: str) -> int:
+        return math.ceil(sum(w * f for w, f in zip(self.weights, features(text)))) + 1
+
+    def fits(self, text: str, limit: int) -> bool | None:
+        """
+        Whether the text surely fits into `limit` tokens,
+        None when it's too close to the limit or the estimator is uncalibrated
+        """
+        if self.error is None:
+            return None
+        tokens = self.estimate(text)
+        if tokens * (1 + self.error) <= limit:
+            return True
+        if tokens * (1 - self.error) > limit:
+            return False
+        return None
+
+    @classmethod
+    def parse(cls, spec: str) -> "TokenEstimator":
+        """
+        Parse weights and the error as printed by the calibration,
+        e.g. `0.62,0.11,0.52,0.98,0.71;0.12`
+        """
+        weights, _, error = spec.partition(";")
+        parsed = tuple(float(w) for w in weights.split(","))
+        if len(parsed) != len(FEATURES):
+            raise ValueError(f"expected {len(FEATURES)} weights, got {len(parsed)}")
+        return cls(parsed, float(error) if error else None)
+
+    def __str__(self) -> str:
+        weights = ",".join(f"{w:.4f}" for w in self.weights)
+        return weights if self.error is None else f"{weights};{self.error:.4f}"
+
+    @classmethod
+    def calibrate(
+        cls, samples: Iterable[tuple[str, int]], quantile: float = 0.99
+    ) -> "TokenEstimator":
+        """
+        Fit the weights on `(text, real token count)` samples with least squares,
+        the expected error is the `quantile` of the relative errors on the samples
+        """
+        samples = list(samples)
+        xs = [features(text) for text, _ in samples]
+        n = len(FEATURES)
+        xtx = [[sum(x[i] * x[j] for x in xs) for j in range(n)] for i in range(n)]
+        xty = [
+            sum(x[i] * (count - 1) for x, (_, count) in zip(xs, samples))
+            for i in range(n)
+        ]
+        estimator = cls(tuple(_solve(xtx, xty)), 0)
+
+        errors = sorted(
+            abs(estimator.estimate(text) - count) / count
+            for text, count in samples
+            if count
+        )
+        if errors:
+            estimator.error = errors[min(len(errors) - 1, int(quantile * len(errors)))]
+        return estimator
+
+
+estimator = TokenEstimator()
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from string import ascii_uppercase
+
+# consecutive messages of the same author are merged into one entry
+# unless they are further apart than this
+COLLAPSE_GAP = timedelta(minutes=5)
+
+LEGEND = (
+    "Every entry is `<number> <author> [+<time since the previous entry>] "
+    "[><number of the entry it replies to>]: <text>`, `>?` replies to an earlier "
+    "message, continuation lines are indented."
+)
+
+
+def alias(index: int) -> str:
+    """A, B, ..., Z, AA, AB, ..."""
+    name = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, len(ascii_uppercase))
+        name = ascii_uppercase[rest] + name
+    return name
+
+
+def format_gap(gap: timedelta) -> str:
+    minutes = int(gap.total_seconds() // 60)
+    if minutes < 1:
+        return ""
+    if minutes < 60:
+        return f" +{minutes}m"
+    if minutes < 24 * 60:
+        return f" +{minutes // 60}h"
+    return f" +{minutes // (24 * 60)}d"
+
+
+def render_transcript(messages: list[dict]) -> str:
+    """
+    Render messages in a compact transcript format for a prompt.
+
+    Messages are dicts with `id`, `author`, `created_at` (a datetime), `message`
+    and optionally `reply_to`. Authors get short aliases, message ids are replaced
+    by entry numbers, timestamps are relative to the previous entry and consecutive
+    messages of the same author are collapsed into one entry.
+    """
+    if not messages:
+        return ""
+    authors: dict[str, str] = {}
+    # message id -> number of the entry it's part of
+    entries: dict[int, int] = {}
+    lines: list[str] = []
+    last: dict | None = None
+    for msg in messages:
+        author = authors.setdefault(msg["author"], alias(len(authors)))
+        text = msg["message"].replace("\n", "\n  ")
+        reply_to = msg.get("reply_to")
+        if (
+            last is not None
+            and reply_to is None
+            and last["author"] == msg["author"]
+            and msg["created_at"] - last["created_at"] <= COLLAPSE_GAP
+        ):
+            lines[-1] += f"\n  {text}"
+            entries[msg["id"]] = len(lines)
+            last = msg
+            continue
+
+        header = f"{len(lines) + 1} {author}"
+        if last is not None:
+            header += format_gap(msg["created_at"] - last["created_at"])
+        if reply_to is not None:
+            header += f" >{entries.get(reply_to, '?')}"
+        lines.append(f"{header}: {text}")
+        entries[msg["id"]] = len(lines)
+        last = msg
+
+    start: datetime = messages[0]["created_at"]
+    legend = ", ".join(f"{a}={name}" for name, a in authors.items())
+    return (
+        f"{LEGEND}\nAuthors: {legend}\n"
+        f"Start: {start.strftime('%Y-%m-%d %H:%M')} UTC\n\n" + "\n".join(lines)
+    )
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from importlib.util import find_spec
+from urllib.parse import urlsplit
+
+import httpx
+
+# HTTP/2 needs the optional `h2` package (`httpx[http2]`), fall back to HTTP/1.1 without it
+HTTP2_AVAILABLE = find_spec("h2") is not None
+# clients nobody borrowed for this long are closed, e.g. the ones of a proxy or
+# a server url that was changed in the config since, well above any request timeout
+IDLE_TIMEOUT = 15 * 60
+
+
+@dataclass(frozen=True)
+class HostSettings:
+    """Connection pool settings for a single upstream host"""
+
+    timeout: float = 10.0
+    max_connections: int = 10
+    max_keepalive: int = 5
+    keepalive_expiry: float = 60.0
+    http2: bool = False
+
+
+DEFAULT_SETTINGS = HostSettings()
+
+HOST_SETTINGS: dict[str, HostSettings] = {
+    "generativelanguage.googleapis.com": HostSettings(
+        timeout=30, max_connections=20, max_keepalive=10, http2=True
+    ),
+    "api.groq.com": HostSettings(
+        timeout=30, max_connections=20, max_keepalive=10, http2=True
+    ),
+    # error/status webhooks
+    "discord.com": HostSettings(http2=True),
+    # avatars
+    "cdn.discordapp.com": HostSettings(http2=True),
+    "reservation-agent.krejzac.cz": HostSettings(timeout=30),
+}
+
+
+class HttpClientPool:
+    def __init__(
+        self,
+        settings: dict[str, HostSettings] = HOST_SETTINGS,
+        idle_timeout: float = IDLE_TIMEOUT,
+    ) -> None:
+        """
+        A registry of long lived `httpx.AsyncClient`s, one keep-alive pool per upstream host.
+
+        Cogs borrow clients with `bot.http_pool.client(url)` for a request and must not
+        close them or keep them around, clients that weren't borrowed for `idle_timeout`
+        seconds are closed and the bot closes the rest on shutdown.
+        """
+        self.settings = settings
+        self.idle_timeout = idle_timeout
+        self._clients: dict[tuple[str, str | None, bool], httpx.AsyncClient] = {}
+        self._last_used: dict[tuple[str, str | None, bool], float] = {}
+        self._closing: set[asyncio.Task] = set()
+
+    def client(
+        self, url: str, *, proxy: str | None = None, verify: bool = True
+    ) -> httpx.AsyncClient:
+        """
+        Get the pooled client for the host of `url`, creating it on first use.
+
+        Requests going through a proxy or without TLS verification get their own pool.
+        """
+        parts = urlsplit(url)
+        key = (f"{parts.scheme}://{parts.netloc}", proxy, verify)
+        now = time.monotonic()
+        self._evict_idle(now)
+        self._last_used[key] = now
+        try:
+            return self._clients[key]
+        except KeyError:
+            settings = self.settings.get(parts.hostname or "", DEFAULT_SETTINGS)
+            client = httpx.AsyncClient(
+                proxy=proxy,
+                verify=verify,
+                http2=settings.http2 and HTTP2_AVAILABLE,
+                timeout=settings.timeout,
+                limits=httpx.Limits(
+                    max_connections=settings.max_connections,
+                    max_keepalive_connections=settings.max_keepalive,
+                    keepalive_expiry=settings.keepalive_expiry,
+                ),
+            )
+            self._clients[key] = client
+            return client
+
+    def _evict_idle(self, now: float) -> None:
+        for key, last_used in list(self._last_used.items()):
+            if now - last_used < self.idle_timeout:
+                continue
+            del self._last_used[key]
+            if (client := self._clients.pop(key, None)) is not None:
+                task = asyncio.create_task(client.aclose())
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+
+    async def aclose(self) -> None:
+        """Close every pooled client"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        self._last_used.clear()
+        for client in clients:
+            await client.aclose()
+        if self._closing:
+            await asyncio.gather(*self._closing)
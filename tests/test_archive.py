@@ -0,0 +1,113 @@
+import sys  # noqa: E402
+from datetime import datetime, timedelta, timezone  # noqa: E402
+from pathlib import Path  # noqa: E402
+from unittest.mock import AsyncMock, MagicMock, patch  # noqa: E402
+
+import pytest  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))  # noqa: E402
+
+from cogs.utils.archive import SPAN_TTL, MessageArchive  # noqa: E402
+
+
+def archive_with_spans(*spans):
+    async def find(query):
+        for start, end in spans:
+            yield {"start": start, "end": end}
+
+    collection = MagicMock()
+    collection.find = find
+    return MessageArchive(MagicMock(), collection)
+
+
+@pytest.mark.asyncio
+async def test_gaps_between_spans():
+    archive = archive_with_spans((30, 40), (10, 20))
+
+    assert await archive._segments(1, 5, 50) == [
+        (5, 10, False),
+        (9, 21, True),
+        (20, 30, False),
+        (29, 41, True),
+        (40, 50, False),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_overlapping_spans_are_merged():
+    archive = archive_with_spans((1, 20), (15, 30), (31, 60))
+
+    assert await archive._segments(1, 5, 50) == [
+        (5, 21, True),
+        (20, 31, True),
+        (30, 50, True),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_live_span_covers_up_to_now():
+    archive = archive_with_spans()
+    archive.live[1] = {"start": 30, "end": 35}
+
+    assert await archive._segments(1, 5, 50) == [(5, 30, False), (29, 50, True)]
+
+
+@pytest.mark.asyncio
+async def test_live_span_after_the_range_is_ignored():
+    archive = archive_with_spans()
+    archive.live[1] = {"start": 100, "end": 120}
+
+    assert await archive._segments(1, 5, 50) == [(5, 50, False)]
+
+
+@pytest.mark.asyncio
+async def test_expired_spans_are_gaps():
+    queries = []
+
+    async def find(query):
+        queries.append(query)
+        return
+        yield
+
+    archive = archive_with_spans()
+    archive.spans.find = find
+
+    assert await archive._segments(1, 5, 50) == [(5, 50, False)]
+    expired = datetime.now(timezone.utc) - timedelta(seconds=SPAN_TTL)
+    assert abs(queries[0]["verified_at"]["$gt"] - expired) < timedelta(minutes=1)
+
+
+@pytest.mark.asyncio
+async def test_refetched_gaps_flag_messages_deleted_meanwhile():
+    archive = archive_with_spans()
+    archive.messages.bulk_write = AsyncMock()
+    archive.messages.update_many = AsyncMock()
+    archive.spans.insert_one = AsyncMock()
+    fetched = [MagicMock(id=12), MagicMock(id=14)]
+    channel = MagicMock(id=1)
+
+    with patch("cogs.utils.archive.fetch_history", AsyncMock(return_value=fetched)):
+        assert await archive.history(channel, 5, 50) == fetched
+
+    query, update = archive.messages.update_many.await_args.args
+    assert query == {"channel_id": 1, "_id": {"$gte": 6, "$lte": 49, "$nin": [12, 14]}}
+    assert update == {"$set": {"deleted": True}}
+    span = archive.spans.insert_one.await_args.args[0]
+    assert (span["start"], span["end"]) == (6, 49)
+    assert "verified_at" in span
+
+
+@pytest.mark.asyncio
+async def test_disabling_the_archive_drops_the_spans():
+    from cogs.archive import ArchiveCog
+
+    cog = ArchiveCog(MagicMock())
+    cog.archive.live[1] = {"start": 30, "end": 35}
+    cog.archive.spans.delete_many = AsyncMock()
+
+    await cog.configure(MagicMock(enabled=1))
+    cog.archive.spans.delete_many.assert_not_awaited()
+
+    await cog.configure(MagicMock(enabled=0))
+    cog.archive.spans.delete_many.assert_awaited_once_with({})
+    assert cog.archive.live == {}
@@ -0,0 +1,359 @@
+import csv  # noqa: E402
+import gzip  # noqa: E402
+import io  # noqa: E402
+import sys  # noqa: E402
+from datetime import datetime, timedelta, timezone  # noqa: E402
+from pathlib import Path  # noqa: E402
+from unittest.mock import AsyncMock, MagicMock  # noqa: E402
+
+import pytest  # noqa: E402
+from pymongo import UpdateOne  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))  # noqa: E402
+
+from cogs.utils.beers import bucket_edges, bucket_starts  # noqa: E402
+from cogs.utils.beers import BeerStore, decode_cursor, encode_cursor  # noqa: E402
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_buckets_follow_prague_days():
+    # 23:30 UTC in summer is already the next day in Prague
+    hour, day = bucket_starts(utc(2024, 7, 1, 23, 30))
+
+    assert hour == utc(2024, 7, 1, 23)
+    assert day == utc(2024, 7, 1, 22)
+
+
+def test_naive_timestamps_are_utc():
+    assert bucket_starts(datetime(2024, 1, 1, 12, 5)) == (
+        utc(2024, 1, 1, 12),
+        utc(2023, 12, 31, 23),
+    )
+
+
+def test_edges_round_up():
+    hour, day = bucket_edges(utc(2024, 1, 1, 12, 5))
+
+    assert hour == utc(2024, 1, 1, 13)
+    assert day == utc(2024, 1, 1, 23)
+
+
+def test_aligned_cutoff_needs_no_events():
+    # the start of a Prague day, as used by the daily leaderboard
+    assert bucket_edges(utc(2024, 1, 1, 23)) == (utc(2024, 1, 1, 23),) * 2
+
+
+def test_edges_across_clock_change():
+    # 2024-03-31 is 23 hours long in Prague
+    hour, day = bucket_edges(utc(2024, 3, 30, 23, 30))
+
+    assert hour == utc(2024, 3, 31, 0)
+    assert day == utc(2024, 3, 31, 22)
+
+
+def test_cursor_round_trip():
+    # timestamps come back from Mongo naive, in milliseconds
+    beer = {"id": "3f1c", "timestamp": datetime(2024, 5, 1, 20, 15, 3, 123000)}
+    cursor = encode_cursor(beer)
+
+    assert cursor == "1714594503123:3f1c"
+    assert decode_cursor(cursor) == (utc(2024, 5, 1, 20, 15, 3, 123000), "3f1c")
+
+
+@pytest.fixture
+def store():
+    db = MagicMock()
+    db.beer_events.insert_one = AsyncMock()
+    db.beer_buckets.bulk_write = AsyncMock()
+    db.beer_tracker.find_one = AsyncMock(
+        return_value={"total_beers": 2, "last_beer": datetime(2024, 5, 1, 20)}
+    )
+    store = BeerStore(db)
+    store.count_since = AsyncMock(return_value=2)
+    return store
+
+
+@pytest.mark.asyncio
+async def test_summary_is_kept_up_to_date_by_logging(store):
+    assert await store.recent(1, "week") == 2
+    store.users.find_one_and_update = AsyncMock(return_value={"total_beers": 3})
+    await store.log(1, "pepa")
+
+    assert await store.total(1) == 3
+    assert await store.recent(1, "week") == 3
+    assert (await store.last(1)).year > 2024
+    assert store.users.find_one.await_count == 1
+    assert store.count_since.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_deleting_the_last_beer_looks_up_the_previous(store):
+    last = datetime(2024, 5, 1, 20)
+    await store.recent(1, "year")
+    store.users.find_one_and_update = AsyncMock(
+        return_value={"total_beers": 1, "last_beer": last}
+    )
+    store.events.find_one = AsyncMock(return_value={"timestamp": datetime(2024, 4, 1)})
+    store.users.update_one = AsyncMock()
+    store.events.find_one_and_delete = AsyncMock(
+        return_value={"id": "3f1c", "user_id": 1, "timestamp": last}
+    )
+    assert (await store.delete("3f1c", 1))["timestamp"] == last
+
+    assert await store.total(1) == 1
+    assert await store.last(1) == utc(2024, 4, 1)
+    # the beer was more than a year ago
+    assert await store.recent(1, "year") == 2
+
+
+@pytest.mark.asyncio
+async def test_only_own_beers_are_deleted(store):
+    store.events.find_one_and_delete = AsyncMock(return_value=None)
+    store.users.find_one_and_update = AsyncMock()
+
+    assert await store.delete("3f1c", 2) is None
+    store.events.find_one_and_delete.assert_awaited_once_with(
+        {"id": "3f1c", "user_id": 2}, {"_id": 0}
+    )
+    store.users.find_one_and_update.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_round_is_one_bulk_write_per_collection(store):
+    async def find(query, projection):
+        for user_id in query["user_id"]["$in"]:
+            yield {"user_id": user_id, "total_beers": 10 + user_id}
+
+    store.events.insert_many = AsyncMock()
+    store.users.bulk_write = AsyncMock()
+    store.users.find = find
+    await store.recent(1, "day")
+    totals = await store.log_round({1: "pepa", 2: "franta"}, 2)
+
+    assert totals == {1: 11, 2: 12}
+    assert len(store.events.insert_many.await_args.args[0]) == 4
+    assert len(store.users.bulk_write.await_args.args[0]) == 2
+    assert store.buckets.bulk_write.await_count == 1
+    assert await store.recent(1, "day") == 4
+
+
+@pytest.mark.asyncio
+async def test_export_writes_gzipped_csv(store):
+    async def users(query, projection):
+        yield {"user_id": 1, "username": "pepa"}
+
+    async def beers():
+        yield {"id": "3f1c", "user_id": 1, "timestamp": datetime(2024, 5, 3, 22, 30)}
+        yield {"id": "9a2b", "user_id": 2, "timestamp": datetime(2024, 5, 4, 9)}
+
+    store.users.find = users
+    store.events.find.return_value.sort.return_value = beers()
+    fp = io.BytesIO()
+
+    assert await store.export(fp) == 2
+    rows = list(csv.reader(io.StringIO(gzip.decompress(fp.getvalue()).decode())))
+    assert rows[0] == ["id", "user_id", "username", "timestamp", "weekday", "hour"]
+    # Friday 22:30 UTC is Saturday past midnight in Prague
+    assert rows[1] == ["3f1c", "1", "pepa", "2024-05-03T22:30:00+00:00", "6", "0"]
+    assert rows[2][2] == ""
+
+
+@pytest.mark.asyncio
+async def test_migrate_moves_embedded_beers_idempotently(store):
+    beers = [
+        {"id": "3f1c", "timestamp": datetime(2024, 5, 1, 20)},
+        {"id": "9a2b", "timestamp": datetime(2024, 5, 2, 21)},
+    ]
+
+    async def find(query):
+        yield {"_id": "a", "user_id": 1, "total_beers": 7, "beers": beers}
+        yield {"_id": "b", "user_id": 2, "beers": []}
+
+    store.users.find = find
+    store.users.update_one = AsyncMock()
+    store.events.bulk_write = AsyncMock()
+    # the first run was interrupted after writing the events of the first user
+    store.events.count_documents = AsyncMock(side_effect=[2, 0, 2, 0])
+    store.rebuild_buckets = AsyncMock()
+    await store.migrate()
+    first = store.events.bulk_write.await_args_list[:]
+    await store.migrate()
+
+    upserts = [
+        UpdateOne(
+            {"id": beer["id"]},
+            {"$setOnInsert": {"id": beer["id"], "user_id": 1, **beer}},
+            upsert=True,
+        )
+        for beer in beers
+    ]
+    # events are upserted by their id, running again can't duplicate them
+    assert first[0].args[0] == upserts
+    assert store.events.bulk_write.await_args_list[1].args[0] == upserts
+    assert store.events.bulk_write.await_count == 2
+    store.users.update_one.assert_any_await(
+        {"_id": "a"}, {"$set": {"total_beers": 2}, "$unset": {"beers": ""}}
+    )
+    store.users.update_one.assert_any_await(
+        {"_id": "b"}, {"$set": {"total_beers": 0}, "$unset": {"beers": ""}}
+    )
+    assert store.rebuild_buckets.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_migrate_without_embedded_beers_does_nothing(store):
+    async def find(query):
+        return
+        yield
+
+    store.users.find = find
+    store.users.update_one = AsyncMock()
+    store.buckets.find_one = AsyncMock(return_value={"_id": 1})
+    store.rebuild_buckets = AsyncMock()
+    await store.migrate()
+
+    store.users.update_one.assert_not_awaited()
+    store.rebuild_buckets.assert_not_awaited()
+
+
+def aggregate(rows, calls):
+    def aggregate(pipeline):
+        calls.append(pipeline)
+
+        async def results():
+            for row in rows:
+                yield row
+
+        return results()
+
+    return aggregate
+
+
+@pytest.mark.asyncio
+async def test_all_time_leaderboard_reads_the_counters(store):
+    calls = []
+    store.users.aggregate = aggregate([{"_id": 1, "count": 5}], calls)
+
+    assert await store.leaderboard(None, 3) == [(1, 5)]
+    assert calls == [
+        [
+            {"$match": {"total_beers": {"$gt": 0}}},
+            {"$sort": {"total_beers": -1}},
+            {"$limit": 3},
+            {"$project": {"_id": "$user_id", "count": "$total_beers"}},
+        ]
+    ]
+
+
+@pytest.mark.asyncio
+async def test_period_leaderboard_is_ranked_by_the_database(store):
+    calls = []
+    store.buckets.aggregate = aggregate(
+        [{"_id": 2, "count": 4}, {"_id": 1, "count": 3}], calls
+    )
+    cutoff = utc(2024, 1, 1, 12, 5)
+
+    assert await store.leaderboard(cutoff, 10) == [(2, 4), (1, 3)]
+    pipeline = calls[0]
+    # day buckets from the first whole day, hour buckets before it
+    # and the events of the first partial hour
+    assert pipeline[0]["$match"]["$or"] == [
+        {"unit": "day", "start": {"$gte": utc(2024, 1, 1, 23)}},
+        {
+            "unit": "hour",
+            "start": {"$gte": utc(2024, 1, 1, 13), "$lt": utc(2024, 1, 1, 23)},
+        },
+    ]
+    events = pipeline[1]["$unionWith"]["pipeline"][0]["$match"]
+    assert events == {"timestamp": {"$gte": cutoff, "$lt": utc(2024, 1, 1, 13)}}
+    assert pipeline[-3:] == [
+        {"$match": {"count": {"$gt": 0}}},
+        {"$sort": {"count": -1, "_id": 1}},
+        {"$limit": 10},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_recounts_the_days_written_to_meanwhile(store):
+    staging = MagicMock()
+    staging.name = "beer_buckets_rebuild"
+    staging.drop = AsyncMock()
+    staging.create_index = AsyncMock()
+    staging.rename = AsyncMock()
+    store.buckets.name = "beer_buckets"
+    store.buckets.database.__getitem__.return_value = staging
+    old = utc(2024, 1, 10, 12, 30)
+    pipelines = []
+
+    async def to_list(length):
+        if len(pipelines) == 1:
+            # an old beer is deleted while the buckets are being built
+            await store._bump([2], old, -1)
+
+    def aggregate(pipeline):
+        pipelines.append(pipeline)
+        return MagicMock(to_list=to_list)
+
+    async def find(query, projection):
+        if "timestamp" in projection:
+            assert query == {
+                "$or": [
+                    {
+                        "user_id": 2,
+                        "timestamp": {
+                            "$gte": utc(2024, 1, 9, 23),
+                            "$lt": utc(2024, 1, 10, 23),
+                        },
+                    }
+                ]
+            }
+            yield {"user_id": 2, "timestamp": old - timedelta(hours=1)}
+        else:
+            # the bucket of the deleted beer, as built into staging
+            yield {"user_id": 2, "unit": "hour", "start": utc(2024, 1, 10, 12)}
+
+    store.events.aggregate = aggregate
+    store.events.find = find
+    store.buckets.find = find
+    await store.rebuild_buckets()
+
+    assert [p[-1]["$merge"]["into"] for p in pipelines] == ["beer_buckets_rebuild"] * 2
+    staging.rename.assert_awaited_once_with("beer_buckets", dropTarget=True)
+    assert store.buckets.bulk_write.await_args.args[0] == [
+        UpdateOne(
+            {"user_id": 2, "unit": "hour", "start": utc(2024, 1, 10, 11)},
+            {"$set": {"count": 1}},
+            upsert=True,
+        ),
+        UpdateOne(
+            {"user_id": 2, "unit": "day", "start": utc(2024, 1, 9, 23)},
+            {"$set": {"count": 1}},
+            upsert=True,
+        ),
+        UpdateOne(
+            {"user_id": 2, "unit": "hour", "start": utc(2024, 1, 10, 12)},
+            {"$set": {"count": 0}},
+            upsert=True,
+        ),
+    ]
+    assert store._rebuilding is None
+
+
+@pytest.mark.asyncio
+async def test_page_buttons_are_not_kept_by_discord():
+    from cogs.beer_tracker import BeerPagesView
+
+    first = {"id": "3f1c", "timestamp": datetime(2024, 5, 2)}
+    last = {"id": "9a2b", "timestamp": datetime(2024, 5, 1)}
+    view = BeerPagesView(2, 10, first, last, True, False)
+
+    # a finished view is sent without being stored for dispatching
+    assert view.is_finished()
+    assert [item.custom_id for item in view.children] == [
+        f"my_beers:newer:2:10:{encode_cursor(first)}",
+        f"my_beers:older:2:10:{encode_cursor(last)}",
+    ]
+    assert [item.disabled for item in view.children] == [False, True]
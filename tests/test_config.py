@@ -0,0 +1,179 @@
+import asyncio  # noqa: E402
+import sys  # noqa: E402
+from pathlib import Path  # noqa: E402
+from unittest.mock import AsyncMock, MagicMock, patch  # noqa: E402
+
+import pytest  # noqa: E402
+from pymongo.errors import OperationFailure, PyMongoError  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))  # noqa: E402
+
+from cogs import _config  # noqa: E402
+from cogs._config import Cfg, ConfigCog, _cached_get, _store  # noqa: E402
+from cogs._config import clear_cache, preload, watch  # noqa: E402
+
+
+@pytest.fixture
+def col():
+    clear_cache()
+    col = MagicMock()
+
+    async def find_one(query):
+        await asyncio.sleep(0)
+        return {"key": query["key"], "value": 1}
+
+    col.find_one = AsyncMock(side_effect=find_one)
+    return col
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_query(col):
+    results = await asyncio.gather(*(_cached_get(col, "cogs.llm") for _ in range(5)))
+
+    assert col.find_one.await_count == 1
+    assert all(result == {"key": "cogs.llm", "value": 1} for result in results)
+
+
+@pytest.mark.asyncio
+async def test_entries_expire(col):
+    await _cached_get(col, "cogs.llm")
+    with patch.object(_config, "CACHE_TTL", -1):
+        clear_cache()
+        await _cached_get(col, "cogs.llm")
+    await _cached_get(col, "cogs.llm")
+
+    assert col.find_one.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_preload_answers_without_queries(col):
+    async def find(query):
+        yield {"key": "cogs.llm", "value": 2}
+
+    col.find = find
+    await preload(col)
+
+    assert await _cached_get(col, "cogs.llm") == {"key": "cogs.llm", "value": 2}
+    assert await _cached_get(col, "cogs.tldr") == {}
+    assert col.find_one.await_count == 0
+
+
+class SnapshotCog(ConfigCog):
+    count = Cfg(int)
+    ratio = Cfg(float, default=0.5)
+
+
+@pytest.mark.asyncio
+async def test_snapshot_is_converted_and_swapped(col):
+    cog = SnapshotCog(MagicMock())
+    _store(cog.key, {"key": cog.key, "count": "3"})
+    snapshot = cog.snapshot
+
+    assert (snapshot.count, snapshot.ratio) == (3, 0.5)
+    with pytest.raises(AttributeError):
+        snapshot.count = 4
+
+    _store(cog.key, {"key": cog.key, "count": "4"})
+    assert cog.snapshot.count == 4
+    # the old snapshot is left as it was
+    assert snapshot.count == 3
+
+
+@pytest.mark.asyncio
+async def test_snapshot_raises_for_missing_options(col):
+    cog = SnapshotCog(MagicMock())
+    _store(cog.key, {"key": cog.key})
+
+    with pytest.raises(KeyError):
+        cog.snapshot.count
+
+
+@pytest.mark.asyncio
+async def test_snapshot_survives_clearing_the_cache(col):
+    cog = SnapshotCog(MagicMock())
+    cog.config = col
+    col.find_one = AsyncMock(return_value={"key": cog.key, "count": "4"})
+    _store(cog.key, {"key": cog.key, "count": "3"})
+    clear_cache()
+
+    # the last known configuration is used while it's loaded again
+    assert cog.snapshot.count == 3
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert col.find_one.await_count == 1
+    assert cog.snapshot.count == 4
+
+
+@pytest.mark.asyncio
+async def test_subscribers_are_notified_of_changes(col):
+    cog = SnapshotCog(MagicMock())
+    seen = []
+
+    async def callback(snapshot):
+        seen.append(snapshot.count)
+
+    unsubscribe = cog.subscribe(callback)
+    _store(cog.key, {"key": cog.key, "count": "1"})
+    # storing the same configuration again is not a change
+    _store(cog.key, {"key": cog.key, "count": "1"})
+    _store(cog.key, {"key": cog.key, "count": "2"})
+    await asyncio.sleep(0)
+    unsubscribe()
+    _store(cog.key, {"key": cog.key, "count": "3"})
+    await asyncio.sleep(0)
+
+    assert seen == [1, 2]
+
+
+class Stream:
+    def __init__(self, changes):
+        self.changes = changes
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def __aiter__(self):
+        for change in self.changes:
+            if isinstance(change, Exception):
+                raise change
+            yield change
+
+
+@pytest.mark.asyncio
+async def test_watch_invalidates_only_what_changed(col):
+    _store("cogs.llm", {"_id": 1, "key": "cogs.llm", "value": 1})
+    _store("cogs.tldr", {"_id": 2, "key": "cogs.tldr", "value": 2})
+    col.watch = MagicMock(
+        side_effect=[
+            Stream([{"operationType": "delete", "documentKey": {"_id": 1}}]),
+            OperationFailure("change streams need a replica set"),
+        ]
+    )
+    await watch(col)
+
+    assert await _cached_get(col, "cogs.llm") == {}
+    assert await _cached_get(col, "cogs.tldr") == {
+        "_id": 2,
+        "key": "cogs.tldr",
+        "value": 2,
+    }
+    assert col.find_one.await_count == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_errors_expire_the_cache(col):
+    _store("cogs.llm", {"_id": 1, "key": "cogs.llm", "value": 2})
+    col.watch = MagicMock(
+        side_effect=[
+            Stream([PyMongoError("connection lost")]),
+            OperationFailure("change streams need a replica set"),
+        ]
+    )
+    with patch.object(_config.asyncio, "sleep", AsyncMock()):
+        await watch(col)
+
+    assert await _cached_get(col, "cogs.llm") == {"key": "cogs.llm", "value": 1}
+    assert col.find_one.await_count == 1
@@ -60,6 +60,18 @@ async def test_create_event(events_cog):
     events_cog.bot.db.events.insert_one.assert_called_once()
 
 
+@pytest.mark.asyncio
+async def test_cog_load_collects_event_messages(events_cog):
+    async def find(query, projection):
+        for message_id in (12345, 67890):
+            yield {"message_id": message_id}
+
+    events_cog.bot.db.events.find = find
+    await events_cog.cog_load()
+
+    assert events_cog.event_messages == {12345, 67890}
+
+
 @pytest.mark.asyncio
 async def test_on_raw_reaction_add_non_event_message(events_cog):
     events_cog.bot.db.events.find_one = AsyncMock(return_value=None)
@@ -75,7 +87,10 @@ async def test_on_raw_reaction_add_non_event_message(events_cog):
 
     await events_cog.on_raw_reaction_add(payload)
 
-    events_cog.bot.db.events.find_one.assert_called_once_with({"message_id": 99999})
+    # unrelated messages are skipped without any I/O
+    events_cog.bot.get_channel.assert_not_called()
+    channel.fetch_message.assert_not_called()
+    events_cog.bot.db.events.find_one.assert_not_called()
 
 
 @pytest.mark.asyncio
@@ -90,6 +105,7 @@ async def test_on_raw_reaction_add_updates_embed(events_cog):
 
     payload = MagicMock()
     payload.message_id = 12345
+    events_cog.event_messages.add(12345)
     payload.user_id = 456
     payload.emoji.name = "👍"
     payload.channel_id = 67890
@@ -127,6 +143,7 @@ async def test_on_raw_reaction_remove(events_cog):
 
     payload = MagicMock()
     payload.message_id = 12345
+    events_cog.event_messages.add(12345)
     payload.user_id = 123
     payload.emoji.name = "👍"
     payload.channel_id = 67890
@@ -0,0 +1,65 @@
+import asyncio  # noqa: E402
+import sys  # noqa: E402
+from pathlib import Path  # noqa: E402
+from unittest.mock import patch  # noqa: E402
+
+import pytest  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))  # noqa: E402
+
+from http_pool import HttpClientPool, HostSettings  # noqa: E402
+
+
+@pytest.mark.asyncio
+async def test_client_is_shared_per_host():
+    pool = HttpClientPool()
+    first = pool.client("https://api.groq.com/openai/v1/chat/completions")
+    second = pool.client("https://api.groq.com/openai/v1/models")
+    other = pool.client("https://svatkyapi.cz/api/day")
+
+    assert first is second
+    assert first is not other
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_proxied_client_gets_its_own_pool():
+    pool = HttpClientPool()
+    direct = pool.client("https://generativelanguage.googleapis.com/v1beta")
+    proxied = pool.client(
+        "https://generativelanguage.googleapis.com/v1beta",
+        proxy="http://localhost:1080",
+        verify=False,
+    )
+
+    assert direct is not proxied
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_host_settings_are_applied():
+    pool = HttpClientPool({"example.com": HostSettings(timeout=3)})
+    client = pool.client("https://example.com/")
+
+    assert client.timeout.read == 3
+    await pool.aclose()
+    assert client.is_closed
+
+
+@pytest.mark.asyncio
+async def test_idle_clients_are_closed():
+    pool = HttpClientPool(idle_timeout=60)
+    with patch("http_pool.time.monotonic", return_value=0):
+        old = pool.client("https://example.com/", proxy="http://localhost:1080")
+        used = pool.client("https://api.groq.com/")
+    with patch("http_pool.time.monotonic", return_value=59):
+        assert pool.client("https://api.groq.com/") is used
+    with patch("http_pool.time.monotonic", return_value=61):
+        new = pool.client("https://example.com/", proxy="http://localhost:1081")
+        await asyncio.sleep(0)
+        assert pool.client("https://api.groq.com/") is used
+
+    assert old.is_closed
+    assert not used.is_closed
+    await pool.aclose()
+    assert new.is_closed
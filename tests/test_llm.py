@@ -0,0 +1,155 @@
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import sys  # noqa: E402
+from pathlib import Path  # noqa: E402
+from unittest.mock import AsyncMock, MagicMock  # noqa: E402
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))  # noqa: E402
+
+from cogs._config import clear_cache  # noqa: E402
+from cogs.llm import LLMCog, gemini_text  # noqa: E402
+from cogs.utils.message_cache import CachedMessage  # noqa: E402
+
+
+@pytest.fixture
+def llm_cog():
+    clear_cache()
+    bot = MagicMock()
+    bot.db.config.find_one = AsyncMock(return_value={})
+    return LLMCog(bot)
+
+
+def make_message(content, reference_id=None):
+    message = MagicMock()
+    message.content = content
+    message.reference = None
+    if reference_id is not None:
+        message.reference = MagicMock()
+        message.reference.message_id = reference_id
+        message.reference.resolved = None
+    message.channel.fetch_message = AsyncMock()
+    return message
+
+
+@pytest.mark.asyncio
+async def test_build_conversation_walks_reply_chain_from_cache(llm_cog):
+    llm_cog.messages.add(CachedMessage(1, "Kdo jsi??", False, None))
+    llm_cog.messages.add(CachedMessage(2, "Jsem bot.", True, 1))
+    llm_cog.messages.add(CachedMessage(3, "A co umíš??", False, 2))
+    llm_cog.messages.add(CachedMessage(4, "Odpovídat.", True, 3))
+    message = make_message("Opravdu??", reference_id=4)
+
+    conversation = await llm_cog.build_conversation(message, "??")
+
+    assert conversation == [
+        {"role": "user", "content": "Kdo jsi?"},
+        {"role": "assistant", "content": "Jsem bot."},
+        {"role": "user", "content": "A co umíš?"},
+        {"role": "assistant", "content": "Odpovídat."},
+        {"role": "user", "content": "Opravdu?"},
+    ]
+    message.channel.fetch_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_build_conversation_truncates_oldest_first(llm_cog):
+    llm_cog.config.find_one = AsyncMock(return_value={"context_max_turns": 3})
+    clear_cache()
+    llm_cog.messages.add(CachedMessage(1, "první??", False, None))
+    llm_cog.messages.add(CachedMessage(2, "odpověď", True, 1))
+    llm_cog.messages.add(CachedMessage(3, "druhá??", False, 2))
+    llm_cog.messages.add(CachedMessage(4, "odpověď 2", True, 3))
+    message = make_message("třetí??", reference_id=4)
+
+    conversation = await llm_cog.build_conversation(message, "??")
+
+    assert conversation == [
+        {"role": "user", "content": "druhá?"},
+        {"role": "assistant", "content": "odpověď 2"},
+        {"role": "user", "content": "třetí?"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_fallback_answers_are_cached_under_the_answering_model(llm_cog):
+    llm_cog.bot.db.config.find_one = AsyncMock(
+        return_value={"stream_responses": 0, "proxy_url": ""}
+    )
+    # load the configuration first, so that its subscribers don't replace the cache
+    await llm_cog._cfg()
+    await asyncio.sleep(0)
+    llm_cog.cache = MagicMock()
+    llm_cog.cache.get = AsyncMock(return_value=None)
+    llm_cog.cache.put = AsyncMock()
+    llm_cog.router.run = AsyncMock(return_value=("llama", "ahoj"))
+    llm_cog.send_chunks = AsyncMock(return_value=[])
+    conversation = [{"role": "user", "content": "hi"}]
+
+    await llm_cog.respond(make_message("hi"), "gemini", conversation)
+
+    llm_cog.cache.get.assert_awaited_once_with("gemini", conversation)
+    llm_cog.cache.put.assert_awaited_once_with("llama", conversation, "ahoj")
+
+
+@pytest.mark.parametrize(
+    "error, shown",
+    [
+        (httpx.ConnectError("refused"), "*Request failed: ConnectError*"),
+        (
+            json.JSONDecodeError("Expecting value", "data: {", 0),
+            "*Did not get a response*",
+        ),
+    ],
+)
+@pytest.mark.asyncio
+async def test_request_errors_replace_the_placeholder(llm_cog, error, shown):
+    llm_cog.bot.db.config.find_one = AsyncMock(
+        return_value={"stream_responses": 1, "stream_edit_interval": 0}
+    )
+    await llm_cog._cfg()
+    await asyncio.sleep(0)
+    llm_cog.cache = MagicMock()
+    llm_cog.cache.get = AsyncMock(return_value=None)
+    llm_cog.router.run = AsyncMock(side_effect=error)
+    message = make_message("hi")
+    placeholder = MagicMock()
+    placeholder.edit = AsyncMock()
+    message.reply = AsyncMock(return_value=placeholder)
+
+    await llm_cog.respond(message, "gemini", [{"role": "user", "content": "hi"}])
+
+    placeholder.edit.assert_awaited_once_with(content=shown)
+
+
+@pytest.mark.asyncio
+async def test_unexpected_errors_replace_the_placeholder(llm_cog):
+    llm_cog.bot.db.config.find_one = AsyncMock(
+        return_value={"stream_responses": 1, "stream_edit_interval": 0}
+    )
+    await llm_cog._cfg()
+    await asyncio.sleep(0)
+    llm_cog.cache = MagicMock()
+    llm_cog.cache.get = AsyncMock(return_value=None)
+    llm_cog.router.run = AsyncMock(side_effect=TypeError("bug"))
+    message = make_message("hi")
+    placeholder = MagicMock()
+    placeholder.edit = AsyncMock()
+    message.reply = AsyncMock(return_value=placeholder)
+
+    with pytest.raises(TypeError):
+        await llm_cog.respond(message, "gemini", [{"role": "user", "content": "hi"}])
+
+    placeholder.edit.assert_awaited_once_with(content="*Something went wrong*")
+
+
+def test_gemini_chunks_without_parts_have_no_text():
+    def chunk(**candidate):
+        return {"candidates": [candidate]}
+
+    assert gemini_text(chunk(content={"parts": [{"text": "ahoj"}]})) == "ahoj"
+    assert gemini_text(chunk(finishReason="STOP")) == ""
+    assert gemini_text(chunk(content={"role": "model"}, finishReason="SAFETY")) == ""
+    assert gemini_text({"promptFeedback": {"blockReason": "OTHER"}}) == ""
@@ -0,0 +1,51 @@
+import sys  # noqa: E402
+from pathlib import Path  # noqa: E402
+
+import pytest  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))  # noqa: E402
+
+from cogs.utils.llm_cache import ResponseCache, cache_key  # noqa: E402
+
+
+def conv(text):
+    return [{"role": "user", "content": text}]
+
+
+def test_cache_key_normalizes_conversation():
+    assert cache_key("m", conv("Kolik je  hodin?")) == cache_key(
+        "m", conv(" kolik je hodin? ")
+    )
+    assert cache_key("m", conv("a")) != cache_key("other", conv("a"))
+
+
+@pytest.mark.asyncio
+async def test_hit_and_miss_counters():
+    cache = ResponseCache()
+
+    assert await cache.get("m", conv("a")) is None
+    await cache.put("m", conv("a"), "odpověď")
+    assert await cache.get("m", conv("A")) == "odpověď"
+
+    assert cache.stats() == {"entries": 1, "hits": 1, "db_hits": 0, "misses": 1}
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    await cache.put("m", conv("a"), "1")
+    await cache.put("m", conv("b"), "2")
+    await cache.get("m", conv("a"))
+    await cache.put("m", conv("c"), "3")
+
+    assert await cache.get("m", conv("b")) is None
+    assert await cache.get("m", conv("a")) == "1"
+    assert await cache.get("m", conv("c")) == "3"
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_not_returned():
+    cache = ResponseCache(ttl=-1)
+    await cache.put("m", conv("a"), "1")
+
+    assert await cache.get("m", conv("a")) is None
@@ -0,0 +1,86 @@
+import asyncio  # noqa: E402
+import sys  # noqa: E402
+from pathlib import Path  # noqa: E402
+
+import pytest  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))  # noqa: E402
+
+from cogs.utils.llm_router import Router, parse_routes  # noqa: E402
+
+
+def test_parse_routes():
+    assert parse_routes("a>b>c; d > b;") == {"a": ["b", "c"], "d": ["b"]}
+
+
+@pytest.mark.asyncio
+async def test_falls_back_on_error():
+    router = Router((RuntimeError,))
+
+    async def call(model, on_text):
+        if model == "gemini":
+            raise RuntimeError("timed out")
+        return f"answer from {model}"
+
+    assert await router.run(["gemini", "llama"], call) == (
+        "llama",
+        "answer from llama",
+    )
+    assert router.stats["gemini"].error_rate() > 0
+
+
+@pytest.mark.asyncio
+async def test_raises_last_error_when_everything_fails():
+    router = Router((RuntimeError,))
+
+    async def call(model, on_text):
+        raise RuntimeError(model)
+
+    with pytest.raises(RuntimeError, match="llama"):
+        await router.run(["gemini", "llama"], call)
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_takes_first_answer():
+    router = Router((RuntimeError,), default_hedge_delay=0.01)
+    cancelled = []
+
+    async def call(model, on_text):
+        if model == "gemini":
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+        return model
+
+    assert await router.run(["gemini", "llama"], call, hedge=True) == (
+        "llama",
+        "llama",
+    )
+    assert cancelled == ["gemini"]
+
+
+@pytest.mark.asyncio
+async def test_no_failover_once_text_was_streamed():
+    router = Router((RuntimeError,))
+    streamed = []
+
+    async def on_text(delta):
+        streamed.append(delta)
+
+    async def call(model, on_text):
+        await on_text(f"{model} ")
+        raise RuntimeError(model)
+
+    with pytest.raises(RuntimeError, match="gemini"):
+        await router.run(["gemini", "llama"], call, on_text)
+    assert streamed == ["gemini "]
+
+
+def test_failing_primary_is_tried_last():
+    router = Router((RuntimeError,))
+    for _ in range(5):
+        router.stats["gemini"].record_failure()
+
+    assert router.order(["gemini", "llama"]) == ["llama", "gemini"]
@@ -0,0 +1,83 @@
+import asyncio  # noqa: E402
+import sys  # noqa: E402
+from pathlib import Path  # noqa: E402
+
+import pytest  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))  # noqa: E402
+
+from cogs.utils.llm_scheduler import ProviderScheduler, QueueFullError  # noqa: E402
+
+
+@pytest.mark.asyncio
+async def test_users_take_turns_in_queue():
+    scheduler = ProviderScheduler(max_in_flight=1, requests_per_minute=6000, burst=100)
+    gate = asyncio.Event()
+    order = []
+    positions = {}
+
+    async def request(user_id, name):
+        async def on_queued(position):
+            positions[name] = position
+
+        async with scheduler.slot(user_id, on_queued):
+            order.append(name)
+            if name == "first":
+                await gate.wait()
+
+    tasks = [asyncio.create_task(request(1, "first"))]
+    await asyncio.sleep(0)
+    for user_id, name in [(1, "a1"), (1, "a2"), (2, "b1")]:
+        tasks.append(asyncio.create_task(request(user_id, name)))
+        await asyncio.sleep(0)
+
+    gate.set()
+    await asyncio.gather(*tasks)
+
+    assert order == ["first", "a1", "b1", "a2"]
+    assert positions == {"a1": 1, "a2": 2, "b1": 2}
+
+
+@pytest.mark.asyncio
+async def test_excess_requests_are_rejected():
+    scheduler = ProviderScheduler(max_in_flight=1, max_queued=1)
+    gate = asyncio.Event()
+
+    async def request():
+        async with scheduler.slot(1):
+            await gate.wait()
+
+    running = asyncio.create_task(request())
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(request())
+    await asyncio.sleep(0)
+
+    with pytest.raises(QueueFullError):
+        async with scheduler.slot(2):
+            pass
+
+    gate.set()
+    await asyncio.gather(running, waiting)
+    assert scheduler.in_flight == 0 and scheduler.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_request_leaves_the_queue():
+    scheduler = ProviderScheduler(max_in_flight=1)
+    gate = asyncio.Event()
+
+    async def request():
+        async with scheduler.slot(1):
+            await gate.wait()
+
+    running = asyncio.create_task(request())
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(request())
+    await asyncio.sleep(0)
+    waiting.cancel()
+    await asyncio.sleep(0)
+
+    assert scheduler.queued == 0
+    gate.set()
+    await running
+    assert scheduler.in_flight == 0
@@ -0,0 +1,66 @@
+import sys  # noqa: E402
+from pathlib import Path  # noqa: E402
+from unittest.mock import AsyncMock, MagicMock  # noqa: E402
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))  # noqa: E402
+
+from cogs.utils.llm_stream import StreamingReply, iter_sse  # noqa: E402
+
+
+def make_message():
+    message = MagicMock()
+    message.reply = AsyncMock(side_effect=lambda *args, **kwargs: AsyncMock())
+    return message
+
+
+@pytest.mark.asyncio
+async def test_iter_sse_parses_data_lines():
+    body = b'data: {"a": 1}\n\n: keep-alive\n\ndata: {"a": 2}\n\ndata: [DONE]\n\n'
+    response = httpx.Response(200, content=body)
+
+    events = [event async for event in iter_sse(response)]
+
+    assert events == [{"a": 1}, {"a": 2}]
+
+
+@pytest.mark.asyncio
+async def test_streaming_reply_edits_placeholder():
+    message = make_message()
+    reply = StreamingReply(message, edit_interval=0)
+
+    await reply.start()
+    await reply.push("Ahoj")
+    await reply.push(" světe")
+    await reply.finish()
+
+    assert message.reply.call_count == 1
+    reply.replies[0].edit.assert_called_with(content="Ahoj světe")
+
+
+@pytest.mark.asyncio
+async def test_streaming_reply_rolls_over_long_text():
+    message = make_message()
+    reply = StreamingReply(message, edit_interval=3600)
+
+    await reply.start()
+    await reply.push("a" * 2500)
+    await reply.finish()
+
+    assert len(reply.replies) == 2
+    reply.replies[0].edit.assert_called_with(content="a" * 2000)
+    assert message.reply.call_args_list[1].args[0] == "a" * 500
+
+
+@pytest.mark.asyncio
+async def test_streaming_reply_fail_replaces_placeholder():
+    message = make_message()
+    reply = StreamingReply(message)
+
+    await reply.start()
+    await reply.fail("*Response timed out*")
+
+    assert len(reply.replies) == 1
+    reply.replies[0].edit.assert_called_with(content="*Response timed out*")
@@ -0,0 +1,81 @@
+import sys  # noqa: E402
+from pathlib import Path  # noqa: E402
+from unittest.mock import AsyncMock, MagicMock, patch  # noqa: E402
+
+import pytest  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))  # noqa: E402
+
+from cogs.utils.mentions import MentionResolver  # noqa: E402
+
+
+def named(name):
+    obj = MagicMock()
+    obj.name = name
+    return obj
+
+
+@pytest.fixture
+def bot():
+    bot = MagicMock()
+    bot.get_user.return_value = None
+    bot.get_channel.return_value = None
+    bot.fetch_user = AsyncMock(side_effect=lambda user_id: named(f"user{user_id}"))
+    return bot
+
+
+@pytest.fixture
+def guild():
+    guild = MagicMock()
+    members = {1: named("pepa")}
+    guild.get_member.side_effect = members.get
+    guild.get_role.side_effect = {5: named("mods")}.get
+    guild.get_channel_or_thread.side_effect = {7: named("general")}.get
+    return guild
+
+
+@pytest.mark.asyncio
+async def test_mentions_are_replaced(bot, guild):
+    resolver = MentionResolver(bot)
+    contents = await resolver.replace_mentions(
+        ["<@1> a <@!2>", "<@&5> v <#7>", "<@&6>"], guild
+    )
+
+    assert contents == ["pepa a user2", "@mods v #general", "<@&6>"]
+
+
+@pytest.mark.asyncio
+async def test_unknown_users_are_fetched_once(bot, guild):
+    resolver = MentionResolver(bot)
+    await resolver.replace_mentions(["<@1> <@2>", "<@!2>", "<@3>"], guild)
+    await resolver.replace_mentions(["<@2> <@3>"], guild)
+
+    fetched = sorted(call.args[0] for call in bot.fetch_user.await_args_list)
+    assert fetched == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_user_cache_is_bounded(bot, guild):
+    resolver = MentionResolver(bot, max_entries=2)
+    await resolver.replace_mentions(["<@2> <@3>"], guild)
+    await resolver.replace_mentions(["<@2>"], guild)
+    await resolver.replace_mentions(["<@4>"], guild)
+
+    # 3 was used least recently
+    assert list(resolver._users) == [2, 4]
+
+
+@pytest.mark.asyncio
+async def test_expired_and_renamed_users_are_looked_up_again(bot, guild):
+    resolver = MentionResolver(bot, ttl=60)
+    with patch("cogs.utils.mentions.time.monotonic", return_value=0):
+        await resolver.replace_mentions(["<@2>"], guild)
+        assert await resolver.replace_mentions(["<@1>"], guild) == ["pepa"]
+    guild.get_member.side_effect = {1: named("pepik")}.get
+    bot.fetch_user.side_effect = lambda user_id: named("renamed")
+
+    with patch("cogs.utils.mentions.time.monotonic", return_value=61):
+        contents = await resolver.replace_mentions(["<@1> <@2>"], guild)
+
+    assert contents == ["pepik renamed"]
+    assert bot.fetch_user.await_count == 2
@@ -0,0 +1,146 @@
+import sys  # noqa: E402
+from pathlib import Path  # noqa: E402
+from unittest.mock import AsyncMock, MagicMock, patch  # noqa: E402
+
+import pytest  # noqa: E402
+from discord.utils import snowflake_time  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))  # noqa: E402
+
+from cogs._config import clear_cache  # noqa: E402
+from cogs.tldr import TldrCog  # noqa: E402
+from cogs.utils.transcript import render_transcript  # noqa: E402
+
+HOUR = 60 * 60 * 1000
+
+
+def snowflake(ms):
+    return ms << 22
+
+
+def message(ms, text="ahoj"):
+    return {
+        "id": snowflake(ms),
+        "author": "pepa",
+        "created_at": snowflake_time(snowflake(ms)),
+        "message": text,
+    }
+
+
+@pytest.fixture
+def tldr_cog():
+    clear_cache()
+    bot = MagicMock()
+    bot.db.config.find_one = AsyncMock(return_value={})
+    return TldrCog(bot)
+
+
+def test_windows_are_aligned_to_periods(tldr_cog):
+    messages = [message(10), message(HOUR - 1), message(HOUR), message(3 * HOUR)]
+    windows = tldr_cog._plan_windows(messages, 1000, 60)
+
+    assert windows == [messages[:2], [messages[2]], [messages[3]]]
+    # a range starting later shares the windows of the periods it covers fully
+    assert tldr_cog._plan_windows(messages[1:], 1000, 60)[1:] == windows[1:]
+
+
+def test_large_periods_are_split(tldr_cog):
+    messages = [message(HOUR + i, "x" * 400) for i in range(5)]
+    tokens = tldr_cog._estimate_tokens("pepa: " + "x" * 400)
+    windows = tldr_cog._plan_windows(messages, 2 * tokens + 1, 60)
+
+    assert [len(window) for window in windows] == [2, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_only_uncached_windows_are_summarized(tldr_cog):
+    # the default window is 6 hours long
+    messages = [message(0), message(6 * HOUR), message(12 * HOUR)]
+    first, second = (messages[0]["id"],) * 2, (messages[1]["id"],) * 2
+    tldr_cog.windows = MagicMock()
+    tldr_cog.windows.get_many = AsyncMock(return_value={first: "1", second: "2"})
+    tldr_cog.windows.put_many = AsyncMock()
+    tldr_cog._reduce_summaries = AsyncMock(return_value="souhrn")
+
+    with patch("cogs.tldr.gemini") as gemini:
+        gemini.count_tokens = AsyncMock(return_value=100)
+        gemini.generate = AsyncMock(return_value="3")
+        assert await tldr_cog._generate_tldr_from_conversation(1, messages) == "souhrn"
+
+    assert gemini.generate.await_count == 1
+    third = (messages[2]["id"],) * 2
+    tldr_cog.windows.put_many.assert_awaited_once_with(
+        1, "gemini-1.5-flash", {third: "3"}
+    )
+    assert tldr_cog._reduce_summaries.await_args.args[1] == ["1", "2", "3"]
+
+
+class Windows:
+    """An in-memory `WindowSummaryCache`"""
+
+    def __init__(self):
+        self.summaries = {}
+
+    async def get_many(self, channel_id, model, windows):
+        return {key: self.summaries[key] for key in windows if key in self.summaries}
+
+    async def put_many(self, channel_id, model, summaries):
+        self.summaries.update(summaries)
+
+
+async def generate(model_name, prompt, timeout):
+    return "part" if prompt.startswith("You are given a part") else "souhrn"
+
+
+@pytest.mark.asyncio
+async def test_uncached_conversations_that_fit_take_one_request(tldr_cog):
+    messages = [message(0), message(6 * HOUR), message(12 * HOUR)]
+    tldr_cog.windows = Windows()
+    tldr_cog._reduce_summaries = AsyncMock()
+
+    with patch("cogs.tldr.gemini") as gemini:
+        gemini.count_tokens = AsyncMock(return_value=100)
+        gemini.generate = AsyncMock(side_effect=generate)
+        assert await tldr_cog._generate_tldr_from_conversation(1, messages) == "souhrn"
+
+    tldr_cog._reduce_summaries.assert_not_awaited()
+    # the completed windows are summarized alongside, the last one is left open
+    assert tldr_cog.windows.summaries == {
+        (messages[0]["id"],) * 2: "part",
+        (messages[1]["id"],) * 2: "part",
+    }
+
+
+@pytest.mark.asyncio
+async def test_overlapping_ranges_reuse_the_window_summaries(tldr_cog):
+    messages = [message(0), message(6 * HOUR), message(12 * HOUR)]
+    tldr_cog.windows = Windows()
+    tldr_cog._reduce_summaries = AsyncMock(return_value="souhrn")
+
+    with patch("cogs.tldr.gemini") as gemini:
+        gemini.count_tokens = AsyncMock(return_value=100)
+        gemini.generate = AsyncMock(side_effect=generate)
+        await tldr_cog._generate_tldr_from_conversation(1, messages)
+        gemini.generate.reset_mock()
+        messages.append(message(12 * HOUR + 1))
+        assert await tldr_cog._generate_tldr_from_conversation(1, messages) == "souhrn"
+
+    # only the tail is summarized again
+    assert gemini.generate.await_count == 1
+    assert render_transcript(messages[2:]) in gemini.generate.await_args.args[1]
+    assert tldr_cog._reduce_summaries.await_args.args[1] == ["part"] * 3
+
+
+@pytest.mark.asyncio
+async def test_bot_edits_keep_the_windows(tldr_cog):
+    tldr_cog.windows = MagicMock()
+    tldr_cog.windows.invalidate = AsyncMock()
+    payload = MagicMock()
+    payload.data = {"content": "...", "author": {"id": "1", "bot": True}}
+
+    await tldr_cog.on_raw_message_edit(payload)
+    tldr_cog.windows.invalidate.assert_not_awaited()
+
+    payload.data["author"]["bot"] = False
+    await tldr_cog.on_raw_message_edit(payload)
+    tldr_cog.windows.invalidate.assert_awaited_once()
@@ -0,0 +1,41 @@
+import sys  # noqa: E402
+from pathlib import Path  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))  # noqa: E402
+
+from cogs.utils.token_estimator import TokenEstimator, features  # noqa: E402
+
+
+def test_calibration_recovers_weights():
+    truth = TokenEstimator((1, 0.1, 0.5, 1, 0.8), 0)
+    texts = ["Ahoj světe!", "hello world 123", '{"a": 1}', "čeština", "x" * 50]
+    estimator = TokenEstimator.calibrate((text, truth.estimate(text)) for text in texts)
+
+    for text in texts:
+        assert abs(estimator.estimate(text) - truth.estimate(text)) <= 1
+
+
+def test_near_the_limit_is_undecided():
+    estimator = TokenEstimator(error=0.1)
+    text = "slovo " * 100
+    tokens = estimator.estimate(text)
+
+    assert estimator.fits(text, tokens * 2) is True
+    assert estimator.fits(text, tokens // 2) is False
+    assert estimator.fits(text, tokens) is None
+
+
+def test_uncalibrated_estimator_defers_to_the_real_count():
+    estimator = TokenEstimator()
+
+    assert estimator.fits("slovo", 1_000_000) is None
+    assert TokenEstimator.parse(str(estimator)).error is None
+
+
+def test_parse_roundtrip():
+    estimator = TokenEstimator((0.5, 0.1, 0.5, 1, 0.7), 0.08)
+    parsed = TokenEstimator.parse(str(estimator))
+
+    assert parsed.weights == estimator.weights
+    assert parsed.error == estimator.error
+    assert features("ab1 č!") == (1, 2, 1, 1, 1)
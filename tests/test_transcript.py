@@ -0,0 +1,52 @@
+import sys  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+from pathlib import Path  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "frontroomsbot"))  # noqa: E402
+
+from cogs.utils.transcript import LEGEND, alias, render_transcript  # noqa: E402
+
+START = datetime(2024, 5, 1, 12, 0)
+
+
+def message(id, author, minutes, text, reply_to=None):
+    msg = {
+        "id": id,
+        "author": author,
+        "created_at": START + timedelta(minutes=minutes),
+        "message": text,
+    }
+    if reply_to is not None:
+        msg["reply_to"] = reply_to
+    return msg
+
+
+def test_aliases():
+    assert [alias(i) for i in (0, 25, 26, 27, 701, 702)] == [
+        "A",
+        "Z",
+        "AA",
+        "AB",
+        "ZZ",
+        "AAA",
+    ]
+
+
+def test_transcript():
+    transcript = render_transcript(
+        [
+            message(101, "pepa", 0, "Jde někdo na oběd?"),
+            message(102, "pepa", 1, "ve 12:30"),
+            message(103, "franta", 3, "jo", reply_to=101),
+            message(104, "pepa", 90, "tak nic", reply_to=99),
+            message(105, "franta", 90, "víc\nřádků"),
+        ]
+    )
+
+    assert transcript == (
+        f"{LEGEND}\nAuthors: A=pepa, B=franta\nStart: 2024-05-01 12:00 UTC\n\n"
+        "1 A: Jde někdo na oběd?\n  ve 12:30\n"
+        "2 B +2m >1: jo\n"
+        "3 A +1h >?: tak nic\n"
+        "4 B: víc\n  řádků"
+    )